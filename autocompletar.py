@@ -0,0 +1,231 @@
+"""Sugestões de preenchimento (autocompletar) para os campos repetitivos do cadastro.
+
+Para cada campo, os valores distintos do catálogo ficam numa lista ordenada de
+chaves normalizadas (sem acentos e sem diferenciar maiúsculas), com a frequência
+de uso e a grafia mais usada de cada uma. As sugestões para um prefixo são o
+intervalo de chaves que começam com ele, achado por busca binária; para prefixos
+de até PREFIXO_PRECALCULADO letras, que abrangem muitos valores, as mais
+frequentes já ficam calculadas, de modo que nenhuma tecla percorre o catálogo.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+import pandas as pd
+
+import diagnostico
+
+CAMPOS_AUTOCOMPLETAR = ['Autor', 'Editora', 'Local', 'Assuntos', 'Localização']
+# Campos com vários valores no mesmo texto: cada parte é sugerida separadamente
+SEPARADORES = {'Assuntos': ';'}
+LIMITE_SUGESTOES = 8
+PREFIXO_PRECALCULADO = 3
+_MAXIMO = '\uffff'
+
+
+def chave_texto(texto):
+    """Forma usada na comparação: sem acentos, minúsculas e espaços simples."""
+    sem_acentos = ''.join(c for c in unicodedata.normalize('NFKD', str(texto)) if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+
+def valores_do_campo(campo, texto):
+    """Valores individuais de um campo preenchido (Assuntos é dividido em partes)."""
+    if texto is None or (isinstance(texto, float) and pd.isna(texto)):
+        return []
+    texto = str(texto)
+    partes = texto.split(SEPARADORES[campo]) if campo in SEPARADORES else [texto]
+    return [' '.join(p.split()) for p in partes if p.strip()]
+
+
+class _IndiceCampo:
+    def __init__(self):
+        self.chaves = []        # chaves normalizadas, ordenadas
+        self.frequencia = {}    # chave -> número de registros que usam o valor
+        self.grafias = {}       # chave -> {grafia: contagem}
+        self.mais_usadas = {}   # prefixo curto -> [(frequencia, chave)] em ordem decrescente
+
+    def construir(self, contagens):
+        self.frequencia = {}
+        self.grafias = {}
+        for valor, contagem in contagens.items():
+            chave = chave_texto(valor)
+            if not chave:
+                continue
+            self.frequencia[chave] = self.frequencia.get(chave, 0) + contagem
+            grafias = self.grafias.setdefault(chave, {})
+            grafias[valor] = grafias.get(valor, 0) + contagem
+        self.chaves = sorted(self.frequencia)
+        # Uma passada agrupa as chaves por prefixo curto e guarda as mais frequentes de cada um
+        grupos = {}
+        for chave, freq in self.frequencia.items():
+            for n in range(1, min(PREFIXO_PRECALCULADO, len(chave)) + 1):
+                grupos.setdefault(chave[:n], []).append((freq, chave))
+        self.mais_usadas = {p: heapq.nlargest(LIMITE_SUGESTOES, itens) for p, itens in grupos.items()}
+
+    def _recalcular_prefixo(self, prefixo):
+        inicio = bisect_left(self.chaves, prefixo)
+        fim = bisect_left(self.chaves, prefixo + _MAXIMO)
+        itens = heapq.nlargest(LIMITE_SUGESTOES, ((self.frequencia[c], c) for c in self.chaves[inicio:fim]))
+        if itens:
+            self.mais_usadas[prefixo] = itens
+        else:
+            self.mais_usadas.pop(prefixo, None)
+
+    def alterar(self, valor, delta):
+        chave = chave_texto(valor)
+        if not chave:
+            return
+        anterior = self.frequencia.get(chave, 0)
+        atual = anterior + delta
+        grafias = self.grafias.setdefault(chave, {})
+        grafias[valor] = grafias.get(valor, 0) + delta
+        if grafias[valor] <= 0:
+            del grafias[valor]
+        if atual <= 0:
+            self.frequencia.pop(chave, None)
+            self.grafias.pop(chave, None)
+            posicao = bisect_left(self.chaves, chave)
+            if posicao < len(self.chaves) and self.chaves[posicao] == chave:
+                del self.chaves[posicao]
+        else:
+            self.frequencia[chave] = atual
+            if anterior == 0:
+                insort(self.chaves, chave)
+        for n in range(1, min(PREFIXO_PRECALCULADO, len(chave)) + 1):
+            prefixo = chave[:n]
+            lista = self.mais_usadas.get(prefixo, [])
+            itens = [item for item in lista if item[1] != chave]
+            if delta < 0 and len(itens) < len(lista) and len(lista) == LIMITE_SUGESTOES:
+                # Uma das mais usadas perdeu uso: outra chave pode ter passado à frente
+                self._recalcular_prefixo(prefixo)
+                continue
+            if atual > 0:
+                itens.append((atual, chave))
+            if itens:
+                self.mais_usadas[prefixo] = heapq.nlargest(LIMITE_SUGESTOES, itens)
+            else:
+                self.mais_usadas.pop(prefixo, None)
+
+    def grafia(self, chave):
+        grafias = self.grafias.get(chave)
+        return max(grafias, key=grafias.get) if grafias else chave
+
+    def sugerir(self, prefixo, limite):
+        if len(prefixo) <= PREFIXO_PRECALCULADO:
+            itens = self.mais_usadas.get(prefixo, [])[:limite]
+        else:
+            inicio = bisect_left(self.chaves, prefixo)
+            fim = bisect_left(self.chaves, prefixo + _MAXIMO, inicio)
+            itens = heapq.nlargest(limite, ((self.frequencia[c], c) for c in self.chaves[inicio:fim]))
+        return [self.grafia(chave) for _, chave in itens]
+
+
+class IndiceSugestoes:
+    """Índices de sugestões dos campos de CAMPOS_AUTOCOMPLETAR, atualizados a cada gravação.
+
+    'construir' pode rodar em outra thread: até terminar, 'sugerir' não retorna nada e as
+    atualizações recebidas são guardadas e aplicadas ao final.
+    """
+
+    def __init__(self, campos=CAMPOS_AUTOCOMPLETAR):
+        self.campos = list(campos)
+        self._indices = {campo: _IndiceCampo() for campo in self.campos}
+        self._por_registro = {}  # (tipologia, registro) -> textos dos campos, para descontar na edição
+        self._pendentes = []
+        self._lock = threading.Lock()
+        self._lock_reconstrucao = threading.Lock()
+        self._reconstruindo = False
+        self.construido = False
+
+    def _montar(self, df):
+        """Índices e textos por registro a partir de um DataFrame com 'Tipologia', 'Registro' e os campos.
+        As contagens partem dos textos distintos de cada coluna (value_counts), e não de cada linha.
+        """
+        indices = {}
+        for campo in self.campos:
+            contagens = {}
+            for texto, contagem in df[campo].dropna().astype(str).value_counts().items():
+                for valor in valores_do_campo(campo, texto):
+                    contagens[valor] = contagens.get(valor, 0) + contagem
+            indices[campo] = _IndiceCampo()
+            indices[campo].construir(contagens)
+        pares = zip(df['Tipologia'].tolist(), df['Registro'].astype(str).tolist())
+        por_registro = dict(zip(pares, zip(*[df[campo].tolist() for campo in self.campos])))
+        return indices, por_registro
+
+    def _trocar(self, indices, por_registro):
+        # Chamado com _lock. Reaplicar é seguro: cada atualização troca os valores guardados do registro
+        self._indices, self._por_registro = indices, por_registro
+        for args in self._pendentes:
+            self._aplicar(*args)
+        self._pendentes = []
+
+    def construir(self, df):
+        """Monta os índices a partir do catálogo carregado."""
+        with diagnostico.medir('autocompletar.construir'):
+            indices, por_registro = self._montar(df)
+            with self._lock:
+                self._trocar(indices, por_registro)
+                self.construido = True
+
+    def atualizar(self, tipologia, registro, linha):
+        """Troca os valores do registro nos índices; 'linha' None (exclusão) apenas os retira."""
+        with self._lock:
+            if not self.construido:
+                self._pendentes.append((tipologia, registro, linha))
+                return
+            if self._reconstruindo:
+                # Também vale para os índices que estão sendo refeitos
+                self._pendentes.append((tipologia, registro, linha))
+            self._aplicar(tipologia, registro, linha)
+
+    def _aplicar(self, tipologia, registro, linha):
+        par = (tipologia, str(registro))
+        anteriores = self._por_registro.pop(par, ())
+        for campo, texto in zip(self.campos, anteriores):
+            for valor in valores_do_campo(campo, texto):
+                self._indices[campo].alterar(valor, -1)
+        if linha is None:
+            return
+        textos = tuple(linha.get(campo) for campo in self.campos)
+        for campo, texto in zip(self.campos, textos):
+            for valor in valores_do_campo(campo, texto):
+                self._indices[campo].alterar(valor, +1)
+        self._por_registro[par] = textos
+
+    def substituir_tipologia(self, tipologia, df_tipologia):
+        """Refaz os índices com as linhas de uma tipologia recarregada após alteração externa.
+        Os índices são montados de novo (como em 'construir') a partir dos textos guardados das
+        demais tipologias e da tipologia recarregada; deve rodar fora da thread da interface.
+        Até a troca, 'sugerir' continua usando os índices anteriores.
+        """
+        colunas = ['Tipologia', 'Registro'] + self.campos
+        with self._lock_reconstrucao, diagnostico.medir('autocompletar.substituir_tipologia', tipologia):
+            with self._lock:
+                if not self.construido:
+                    return
+                restantes = [par + textos for par, textos in self._por_registro.items() if par[0] != tipologia]
+                self._reconstruindo = True
+            try:
+                novas = df_tipologia.assign(Tipologia=tipologia)[colunas]
+                partes = [p for p in (pd.DataFrame(restantes, columns=colunas), novas) if not p.empty]
+                df = pd.concat(partes, ignore_index=True) if partes else novas
+                indices, por_registro = self._montar(df)
+            except Exception:
+                with self._lock:
+                    self._pendentes = []
+                    self._reconstruindo = False
+                raise
+            with self._lock:
+                self._trocar(indices, por_registro)
+                self._reconstruindo = False
+
+    def sugerir(self, campo, texto, limite=LIMITE_SUGESTOES):
+        """Valores mais usados do campo que começam com 'texto' (na grafia mais comum)."""
+        prefixo = chave_texto(texto)
+        if not self.construido or not prefixo or campo not in self._indices:
+            return []
+        with diagnostico.medir('autocompletar.sugerir'):
+            return self._indices[campo].sugerir(prefixo, limite)
@@ -0,0 +1,298 @@
+"""Cópias de segurança incrementais e deduplicadas das planilhas do catálogo.
+
+Cada cópia ('instantâneo') registra, por tipologia, a lista de blocos de linhas
+que compõem a planilha naquele momento. Os blocos são guardados uma única vez em
+'backups/objetos/', endereçados pelo SHA-256 do seu conteúdo; as fronteiras entre
+blocos dependem do conteúdo das linhas (e não da posição), de modo que incluir,
+editar ou excluir um registro só gera um bloco novo. Tipologias cujas planilhas
+não mudaram desde a última cópia (mesmo hash) reaproveitam a entrada anterior sem
+reler o Excel. Instantâneo e poda usam a mesma trava da pasta de cópias, porque os
+blocos de um instantâneo em andamento ainda não são referenciados por nenhum arquivo.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import bloqueio
+import catalogo
+import diagnostico
+from bloqueio import versao_arquivo
+from exportacao import iterar_linhas_planilha
+
+PASTA_BACKUPS = 'backups'
+# Intervalo entre cópias automáticas (segundos)
+INTERVALO_PADRAO = 30 * 60
+# Uma linha cujo hash é múltiplo deste divisor encerra o bloco (blocos de ~64 linhas em média)
+DIVISOR_BLOCO = 64
+# Limite de linhas por bloco, para que sequências sem fronteira não gerem blocos enormes
+MAXIMO_LINHAS_BLOCO = 1024
+# Espera máxima da poda pela trava: um instantâneo de um catálogo grande pode levar minutos
+ESPERA_PODA = 15 * 60
+
+
+def _pasta_objetos(pasta_backups):
+    return os.path.join(pasta_backups, 'objetos')
+
+
+def _pasta_instantaneos(pasta_backups):
+    return os.path.join(pasta_backups, 'instantaneos')
+
+
+@contextmanager
+def _travar_backups(pasta_backups, espera_maxima=bloqueio.ESPERA_MAXIMA):
+    """Trava a pasta de cópias durante o bloco (instantâneo ou poda)."""
+    os.makedirs(pasta_backups, exist_ok=True)
+    try:
+        with bloqueio.bloquear(_pasta_instantaneos(pasta_backups), espera_maxima=espera_maxima):
+            yield
+    except bloqueio.BloqueioError as e:
+        raise catalogo.CatalogoError("A pasta de cópias de segurança está em uso por outra cópia ou poda. Tente novamente em instantes.") from e
+
+
+def _caminho_objeto(pasta_backups, chave):
+    return os.path.join(_pasta_objetos(pasta_backups), chave[:2], f'{chave}.json.gz')
+
+
+def _gravar_atomico(caminho, dados):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+
+
+def _serializar_linha(valores):
+    # default=str cobre datas/horas lidas como datetime pelo openpyxl
+    return json.dumps(valores, ensure_ascii=False, default=str, separators=(',', ':'))
+
+
+def _gravar_bloco(pasta_backups, linhas):
+    """Guarda o bloco (lista de linhas serializadas) se ainda não existir; retorna (chave, novo)."""
+    conteudo = ('\n'.join(linhas) + '\n').encode('utf-8')
+    chave = hashlib.sha256(conteudo).hexdigest()
+    caminho = _caminho_objeto(pasta_backups, chave)
+    if os.path.exists(caminho):
+        return chave, False
+    # mtime=0 deixa o arquivo comprimido idêntico para o mesmo conteúdo
+    _gravar_atomico(caminho, gzip.compress(conteudo, mtime=0))
+    return chave, True
+
+
+def _ler_bloco(pasta_backups, chave):
+    with open(_caminho_objeto(pasta_backups, chave), 'rb') as f:
+        conteudo = gzip.decompress(f.read())
+    if hashlib.sha256(conteudo).hexdigest() != chave:
+        raise catalogo.CatalogoError(f"Bloco de cópia de segurança corrompido: {chave}")
+    return [json.loads(linha) for linha in conteudo.decode('utf-8').splitlines()]
+
+
+def hash_conteudo(arquivos):
+    """SHA-256 do conteúdo dos arquivos, na ordem informada."""
+    h = hashlib.sha256()
+    for caminho in arquivos:
+        h.update(os.path.basename(caminho).encode('utf-8') + b'\0')
+        with open(caminho, 'rb') as f:
+            for parte in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(parte)
+    return h.hexdigest()
+
+
+def listar_instantaneos(pasta_backups=PASTA_BACKUPS):
+    """Identificadores dos instantâneos ('AAAAMMDD-HHMMSS-ffffff'), do mais antigo ao mais recente."""
+    pasta = _pasta_instantaneos(pasta_backups)
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(nome[:-len('.json')] for nome in os.listdir(pasta) if nome.endswith('.json'))
+
+
+def ler_instantaneo(identificador, pasta_backups=PASTA_BACKUPS):
+    with open(os.path.join(_pasta_instantaneos(pasta_backups), f'{identificador}.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _copiar_tipologia(arquivos, pasta_backups):
+    """Divide as linhas da tipologia em blocos e guarda os novos. Retorna (blocos, linhas, blocos_novos)."""
+    blocos, atual = [], []
+    total = novos = 0
+    for filename in arquivos:
+        for valores in iterar_linhas_planilha(filename):
+            linha = _serializar_linha(valores)
+            atual.append(linha)
+            total += 1
+            fronteira = int(hashlib.sha1(linha.encode('utf-8')).hexdigest()[:8], 16) % DIVISOR_BLOCO == 0
+            if fronteira or len(atual) >= MAXIMO_LINHAS_BLOCO:
+                chave, novo = _gravar_bloco(pasta_backups, atual)
+                blocos.append(chave)
+                novos += novo
+                atual = []
+    if atual:
+        chave, novo = _gravar_bloco(pasta_backups, atual)
+        blocos.append(chave)
+        novos += novo
+    return blocos, total, novos
+
+
+def criar_instantaneo(pasta='', pasta_backups=PASTA_BACKUPS):
+    """Cria um instantâneo com as tipologias alteradas desde o anterior.
+    Retorna o identificador criado, ou None se nada mudou.
+    """
+    with _travar_backups(pasta_backups), diagnostico.medir('backup.instantaneo'):
+        existentes = listar_instantaneos(pasta_backups)
+        anterior = ler_instantaneo(existentes[-1], pasta_backups)['tipologias'] if existentes else {}
+        entradas = {}
+        alteradas = []
+        for tipologia in catalogo.tipologias:
+            entrada = _copiar_se_alterada(tipologia, anterior.get(tipologia), pasta, pasta_backups)
+            if entrada is None:
+                continue
+            entradas[tipologia] = entrada
+            if tipologia not in anterior or entrada['hash'] != anterior[tipologia]['hash']:
+                alteradas.append(tipologia)
+        # Tipologias que deixaram de existir também contam como alteração
+        if not alteradas and set(entradas) == set(anterior):
+            return None
+        identificador = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        instantaneo = {'versao': 1, 'data': datetime.now().isoformat(timespec='seconds'),
+                       'colunas': catalogo.all_columns, 'alteradas': alteradas, 'tipologias': entradas}
+        _gravar_atomico(os.path.join(_pasta_instantaneos(pasta_backups), f'{identificador}.json'),
+                        json.dumps(instantaneo, ensure_ascii=False, indent=1).encode('utf-8'))
+    diagnostico.contar('backup.tipologias_alteradas', len(alteradas))
+    return identificador
+
+
+def _copiar_se_alterada(tipologia, anterior, pasta, pasta_backups):
+    """Entrada do instantâneo para a tipologia: a anterior, se nada mudou, ou uma nova.
+    As planilhas são lidas sem trava; se mudarem durante a leitura, a cópia é refeita.
+    """
+    for _ in range(catalogo.TENTATIVAS_CONCORRENCIA):
+        arquivos = catalogo.arquivos_da_tipologia(tipologia, pasta)
+        if not arquivos:
+            return None
+        versoes = {os.path.basename(c): list(versao_arquivo(c) or ()) for c in arquivos}
+        if anterior is not None and anterior.get('versoes') == versoes:
+            return anterior
+        conteudo = hash_conteudo(arquivos)
+        if anterior is not None and anterior.get('hash') == conteudo:
+            # Mesmo conteúdo com data de modificação diferente: só atualiza as versões
+            return dict(anterior, versoes=versoes)
+        blocos, linhas, novos = _copiar_tipologia(arquivos, pasta_backups)
+        if all(list(versao_arquivo(c) or ()) == versoes[os.path.basename(c)] for c in arquivos):
+            diagnostico.contar('backup.blocos_novos', novos)
+            return {'hash': conteudo, 'versoes': versoes, 'linhas': linhas, 'blocos': blocos}
+        diagnostico.contar('concorrencia.repeticoes')
+    print(f"AVISO: '{tipologia}' mudou durante a cópia de segurança; mantida a cópia anterior.")
+    return anterior
+
+
+def instantaneo_em(instante, pasta_backups=PASTA_BACKUPS):
+    """Identificador do último instantâneo feito até 'instante' (datetime ou identificador); None se não houver."""
+    if isinstance(instante, datetime):
+        instante = instante.strftime('%Y%m%d-%H%M%S-%f')
+    anteriores = [i for i in listar_instantaneos(pasta_backups) if instante is None or i <= instante]
+    return anteriores[-1] if anteriores else None
+
+
+def carregar_do_instantaneo(tipologia, identificador, pasta_backups=PASTA_BACKUPS):
+    """DataFrame da tipologia como estava no instantâneo."""
+    instantaneo = ler_instantaneo(identificador, pasta_backups)
+    entrada = instantaneo['tipologias'].get(tipologia)
+    colunas = instantaneo.get('colunas', catalogo.all_columns)
+    if entrada is None:
+        return pd.DataFrame(columns=catalogo.all_columns)
+    linhas = [linha for chave in entrada['blocos'] for linha in _ler_bloco(pasta_backups, chave)]
+    df = pd.DataFrame(linhas, columns=colunas)
+    for col in catalogo.all_columns:
+        if col not in df.columns:
+            df[col] = None
+    return df[catalogo.all_columns]
+
+
+def restaurar_tipologia(tipologia, instante=None, pasta='', pasta_backups=PASTA_BACKUPS):
+    """Restaura a tipologia como estava no último instantâneo até 'instante' (o mais recente, se None).
+    Antes, faz um instantâneo do estado atual, para que a restauração possa ser desfeita.
+    Retorna o identificador restaurado.
+    """
+    identificador = instantaneo_em(instante, pasta_backups)
+    if identificador is None:
+        raise catalogo.CatalogoError("Não há cópia de segurança anterior à data informada.")
+    with diagnostico.medir('backup.restaurar', tipologia):
+        df = carregar_do_instantaneo(tipologia, identificador, pasta_backups)
+        criar_instantaneo(pasta, pasta_backups)
+        catalogo.gravar_tipologia(tipologia, df, pasta)
+    return identificador
+
+
+def podar(manter, pasta_backups=PASTA_BACKUPS):
+    """Mantém apenas os 'manter' instantâneos mais recentes e apaga os blocos que ficaram sem uso.
+    Retorna (instantaneos_removidos, blocos_removidos).
+    """
+    with _travar_backups(pasta_backups, ESPERA_PODA):
+        existentes = listar_instantaneos(pasta_backups)
+        removidos = existentes[:-manter] if manter > 0 else existentes
+        for identificador in removidos:
+            os.remove(os.path.join(_pasta_instantaneos(pasta_backups), f'{identificador}.json'))
+        em_uso = set()
+        for identificador in listar_instantaneos(pasta_backups):
+            for entrada in ler_instantaneo(identificador, pasta_backups)['tipologias'].values():
+                em_uso.update(entrada['blocos'])
+        blocos_removidos = 0
+        pasta_objetos = _pasta_objetos(pasta_backups)
+        if os.path.isdir(pasta_objetos):
+            for raiz, _, nomes in os.walk(pasta_objetos):
+                for nome in nomes:
+                    if nome.endswith('.json.gz') and nome[:-len('.json.gz')] not in em_uso:
+                        os.remove(os.path.join(raiz, nome))
+                        blocos_removidos += 1
+    return len(removidos), blocos_removidos
+
+
+class AgendadorBackup:
+    """Faz cópias de segurança numa thread própria, a cada 'intervalo' segundos e ao encerrar.
+
+    'ao_concluir(identificador, erro)' é chamado na thread do agendador após cada cópia.
+    """
+
+    def __init__(self, pasta='', pasta_backups=PASTA_BACKUPS, intervalo=INTERVALO_PADRAO, ao_concluir=None):
+        self.pasta = pasta
+        self.pasta_backups = pasta_backups
+        self.intervalo = intervalo
+        self.ao_concluir = ao_concluir
+        self._agora = threading.Event()
+        self._encerrar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name='AgendadorBackup', daemon=True)
+        self._thread.start()
+
+    def executar_agora(self):
+        self._agora.set()
+
+    def encerrar(self):
+        """Pede a última cópia e o fim da thread, sem esperar; use 'ativo()' para acompanhar."""
+        self._encerrar.set()
+        self._agora.set()
+
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _copiar(self):
+        try:
+            identificador, erro = criar_instantaneo(self.pasta, self.pasta_backups), None
+        except Exception as e:
+            identificador, erro = None, e
+            print(f"AVISO: Falha na cópia de segurança: {e}")
+        if self.ao_concluir:
+            self.ao_concluir(identificador, erro)
+
+    def _executar(self):
+        while not self._encerrar.is_set():
+            self._agora.wait(self.intervalo)
+            self._agora.clear()
+            self._copiar()
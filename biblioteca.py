@@ -1,26 +1,46 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import pandas as pd
 import os
 import subprocess
-from datetime import datetime
 from PIL import Image, ImageTk
 import re
 import sys
 import hashlib
-import unicodedata
-import math
+from datetime import datetime
+import threading
+import queue
+
+from catalogo import (
+    campos_registro, tipologias, all_columns, CatalogoError,
+    get_filename_for_tipologia, validar_data, carregar_catalogo, normalizar_planilha,
+    adicionar_registro, remover_registro, atualizar_registro, filtrar_catalogo,
+    preparar_exibicao, carregar_tipologia, substituir_tipologia, ao_gravar, ConflitoEdicaoError,
+    ler_manifesto, arquivos_da_tipologia, ao_alterar_registro,
+)
+import autocompletar
+import backup
+import diagnostico
+import exportacao
+import indice_cdu
+import inventario
+import monitor_arquivos
 
 # --- VARIÁVEIS GLOBAIS ---
 df_global = None # DataFrame em memória para acesso rápido
-
-def get_filename_for_tipologia(tipologia):
-    """Gera um nome de arquivo padronizado para uma dada tipologia."""
-    # Remove acentos, troca espaços por underscore e converte para minúsculas
-    normalized = unicodedata.normalize('NFKD', tipologia)
-    ascii_only = normalized.encode('ASCII', 'ignore').decode('ASCII')
-    safe_name = ascii_only.lower().replace(' ', '_')
-    return f'biblioteca_{safe_name}.xlsx'
+df_visivel = None # Registros exibidos atualmente na tabela de pesquisa (com ou sem filtro)
+catalogo_carregado = False # True depois que a pesquisa carregou todas as planilhas ao menos uma vez
+termo_filtro_atual = "" # Termo aplicado na última filtragem (vazio = mostrando todos)
+consulta_estante = None # (início, fim) da listagem em ordem de estante exibida, ou None
+itens_por_tipologia = {} # Itens da Treeview agrupados por tipologia, para atualização incremental
+edicoes_abertas = {} # (tipologia, registro) -> dados da janela de edição aberta
+encerrando = False # True enquanto a última cópia de segurança é feita ao fechar
+indice_estante = indice_cdu.IndiceCDU() # Números de chamada (CDU + Cutter) em ordem de estante
+indice_sugestoes = autocompletar.IndiceSugestoes() # Valores já usados em Autor, Editora, Local...
+LIMITE_LINHAS_INVENTARIO = 5000 # Linhas do resultado do inventário exibidas na janela (o relatório tem todas)
+fila_recargas = queue.Queue() # Planilhas relidas pelo monitor, aguardando aplicação na thread da interface
+# Última versão de cada tipologia recarregada à espera de entrar nas sugestões (uma thread as aplica em ordem)
+sugestoes_pendentes = {'tipologias': {}, 'trabalhando': False, 'lock': threading.Lock()}
 
 # --- FUNÇÕES ---
 def _license_file_path():
@@ -40,62 +60,6 @@ def _license_valid():
     except Exception:
         return False
 
-def _normalize_numero_value(val):
-    """Normaliza o valor do campo 'Número' SEM usar float.
-    - se for composto apenas por dígitos, retorna int
-    - caso contrário, retorna a string original (sem conversão numérica)
-    Isso evita que o campo vire 10.0, 10.5 etc. e facilita edição/salvamento.
-    """
-    s = str(val).strip()
-    if s == "":
-        return ""
-    if s.isdigit():
-        try:
-            return int(s)
-        except Exception:
-            return s
-    # Qualquer outra coisa permanece como texto
-    return s
-
-def _format_numero_for_display(val):
-    """Formata o campo 'Número' para exibição na tabela.
-    Sempre mostra apenas dígitos (sem casas decimais) ou vazio quando não houver valor.
-    """
-    # Tratar ausentes e NaN
-    if val is None:
-        return ""
-    if isinstance(val, float) and (math.isnan(val)):
-        return ""
-    s = str(val).strip()
-    if s == "" or s.lower() == "nan":
-        return ""
-    # Se conseguir virar inteiro, mostra como inteiro
-    if s.isdigit():
-        return str(int(s))
-    try:
-        i = int(float(s.replace(',', '.')))
-        return str(i)
-    except Exception:
-        # Em falha de parsing, não exibe nada para evitar lixo na tela
-        return ""
-
-def _normalize_int_field(val):
-    """Normaliza campos que devem ser inteiros (Volume, Ano, Exemplar, Quantidade).
-    - vazio -> ""
-    - somente dígitos -> int
-    - qualquer outra coisa -> texto original (sem lançar erro)
-    """
-    s = str(val).strip()
-    if s == "":
-        return ""
-    if s.isdigit():
-        try:
-            return int(s)
-        except Exception:
-            return s
-    # Se não forem só dígitos, mantém como texto
-    return s
-
 def _request_activation(parent):
     for _ in range(3):
         pwd = simpledialog.askstring('Ativação', 'Digite a senha para ativar:', show='*', parent=parent)
@@ -122,20 +86,6 @@ def inicializar_dados():
     df_global = pd.DataFrame(columns=all_columns)
     pass
 
-def validar_data(data_str):
-    if not data_str:
-        return True
-    s = str(data_str).strip()
-    # Exige exatamente DD/MM/AAAA com dois dígitos para dia e mês
-    if not re.match(r'^(0[1-9]|[12][0-9]|3[01])\/(0[1-9]|1[0-2])\/[0-9]{4}$', s):
-        return False
-    try:
-        # Validação de calendário (ex.: rejeita 31/02/2024)
-        datetime.strptime(s, '%d/%m/%Y')
-        return True
-    except ValueError:
-        return False
-
 def salvar_dados(tipologia, entries, obs_text):
     """Coleta, valida e salva os dados em sua respectiva planilha de tipologia."""
     dados = {entry['label']: entry['widget'].get() for entry in entries}
@@ -150,73 +100,17 @@ def salvar_dados(tipologia, entries, obs_text):
         messagebox.showwarning("Atenção", "Formato de data inválido. Use DD/MM/AAAA.")
         return
 
-    # Normaliza campo 'Número' antes de salvar (inteiro quando possível, senão decimal)
-    if 'Número' in dados:
-        dados['Número'] = _normalize_numero_value(dados.get('Número', ''))
-
-    # Normaliza campos numéricos inteiros adicionais (Exemplar tratado como texto livre)
-    for campo_int in ['Volume', 'Ano', 'Quantidade']:
-        if campo_int in dados:
-            dados[campo_int] = _normalize_int_field(dados.get(campo_int, ''))
-
-    filename = get_filename_for_tipologia(tipologia)
-    df_local = pd.DataFrame(columns=all_columns)
-    if os.path.exists(filename):
-        df_local = pd.read_excel(filename, dtype={'Registro': str})
-        # Normaliza nomes de colunas (remove espaços nas bordas)
-        df_local.columns = [str(c).strip() for c in df_local.columns]
-        # Garante que todas as colunas existam
-        for col in all_columns:
-            if col not in df_local.columns:
-                df_local[col] = ""
-
-    # --- Numeração sequencial por Tipologia para 'Registro' ---
-    def _parse_registro_numeric(s):
-        try:
-            return int(str(s)) if str(s).isdigit() else None
-        except Exception:
-            return None
-    existentes_nums = [n for n in ( _parse_registro_numeric(v) for v in (df_local['Registro'].tolist() if 'Registro' in df_local.columns else []) ) if n is not None]
-    atual_max = max(existentes_nums) if existentes_nums else 0
-    proximo_num = atual_max + 1
-    # Largura mínima 5; aumenta conforme necessário
-    largura_existente = max([len(str(x)) for x in existentes_nums], default=0)
-    largura = max(5, largura_existente, len(str(proximo_num)))
-    registro_sequencial = str(proximo_num).zfill(largura)
-
-    # Validação da entrada do usuário e padronização
-    reg_usuario = str(dados.get('Registro', '')).strip()
-    if not reg_usuario.isdigit() or reg_usuario != registro_sequencial:
-        # Força o próximo sequencial e informa o usuário
-        dados['Registro'] = registro_sequencial
-    else:
-        # Mesmo se o usuário acertar, normaliza zero-padding conforme largura calculada
-        dados['Registro'] = str(int(reg_usuario)).zfill(largura)
-
-    if 'Registro' in df_local.columns and not df_local.empty:
-        registros_existentes = df_local['Registro'].astype(str).tolist()
-        if dados['Registro'] in registros_existentes:
-            messagebox.showerror("Erro", f"O Registro '{dados['Registro']}' já existe na planilha {filename}!")
-            return
-
     try:
-        novo_registro = pd.DataFrame([dados])
-        # Garante que o novo registro tenha todas as colunas
-        for col in all_columns:
-            if col not in novo_registro.columns:
-                novo_registro[col] = ""
-        df_local = pd.concat([df_local, novo_registro], ignore_index=True)
-        # Reordena colunas antes de salvar
-        df_local = df_local[all_columns]
-        # Garante que 'Registro' seja texto para preservar zeros à esquerda no Excel
-        if 'Registro' in df_local.columns:
-            df_local['Registro'] = df_local['Registro'].astype(str)
-        df_local.to_excel(filename, index=False)
+        # O span da ação cobre só o trabalho, não o tempo dos diálogos
+        with diagnostico.acao('salvar_dados'):
+            adicionar_registro(tipologia, dados)
+            # Limpa os campos após salvar com sucesso
+            limpar_campos(entries, obs_text)
+            # Atualiza a visualização na aba de pesquisa
+            atualizar_visualizacao_pesquisa()
         messagebox.showinfo("Sucesso", "Dados salvos com sucesso!")
-        # Limpa os campos após salvar com sucesso
-        limpar_campos(entries, obs_text)
-        # Atualiza a visualização na aba de pesquisa
-        atualizar_visualizacao_pesquisa()
+    except CatalogoError as e:
+        messagebox.showerror("Erro", str(e))
     except Exception as e:
         messagebox.showerror("Erro ao Salvar", f"Ocorreu um erro ao salvar os dados.\nVerifique se o arquivo Excel não está aberto.\n\nErro: {e}")
 
@@ -225,30 +119,157 @@ def limpar_campos(entries, obs_text):
         entry['widget'].delete(0, tk.END)
     obs_text.delete("1.0", tk.END)
 
+def _abrir_arquivo(filename):
+    if os.name == 'nt': os.startfile(filename)
+    else: subprocess.call(('open' if sys.platform == 'darwin' else 'xdg-open', filename))
+
+def _exportar_em_segundo_plano(janela, progresso_bar, status_label, cancelar_evento, fonte, filename, formato, mensagem_sucesso):
+    """Exporta 'fonte' para 'filename' numa thread, mostrando o progresso em 'janela'.
+    Ao terminar, fecha a janela, mostra 'mensagem_sucesso' (se houver) e abre o arquivo (xlsx/csv).
+    """
+    mensagens = queue.Queue()
+
+    def _trabalho():
+        try:
+            total = exportacao.exportar(fonte, filename, formato,
+                                        progresso=lambda feitas, total: mensagens.put(('progresso', feitas, total)),
+                                        cancelar=cancelar_evento)
+            mensagens.put(('fim', total, filename))
+        except exportacao.ExportacaoCancelada:
+            mensagens.put(('cancelado',))
+        except Exception as e:
+            mensagens.put(('erro', e))
+
+    def _acompanhar():
+        try:
+            while True:
+                msg = mensagens.get_nowait()
+                if msg[0] == 'progresso':
+                    feitas, total = msg[1], msg[2]
+                    progresso_bar['value'] = 100 * feitas / total if total else 100
+                    status_label.config(text=f"{feitas} de {total} registros...")
+                elif msg[0] == 'fim':
+                    progresso_bar['value'] = 100
+                    status_label.config(text=f"{msg[1]} registros exportados.")
+                    janela.destroy()
+                    extensao = os.path.splitext(msg[2])[1]
+                    if mensagem_sucesso:
+                        messagebox.showinfo("Sucesso", mensagem_sucesso)
+                    if extensao in ('.xlsx', '.csv'):
+                        try:
+                            _abrir_arquivo(msg[2])
+                        except Exception as e:
+                            messagebox.showerror("Erro", f"Não foi possível abrir o arquivo.\n{e}")
+                    return
+                elif msg[0] == 'cancelado':
+                    janela.destroy()
+                    messagebox.showinfo("Cancelado", "Exportação cancelada.")
+                    return
+                elif msg[0] == 'erro':
+                    janela.destroy()
+                    messagebox.showerror("Erro ao Gerar Planilha", f"Não foi possível criar ou abrir a planilha '{filename}'.\n\nErro: {msg[1]}")
+                    return
+        except queue.Empty:
+            pass
+        janela.after(100, _acompanhar)
+
+    status_label.config(text="Exportando...")
+    threading.Thread(target=_trabalho, daemon=True).start()
+    _acompanhar()
+
 def abrir_planilha_geral():
-    """Salva o DataFrame global consolidado em um único arquivo Excel e o abre."""
-    global df_global
-    if df_global is None or df_global.empty:
-        messagebox.showwarning("Atenção", "Não há dados para exportar. Realize uma pesquisa ou clique em 'Mostrar Todos' primeiro.")
-        return
+    """Exporta o catálogo consolidado em segundo plano, com progresso e cancelamento.
+    A exportação lê direto das planilhas (ou da visualização atual) e grava linha a linha.
+    """
+    export_window = tk.Toplevel(app)
+    export_window.title("Ver Planilha Geral")
+    export_window.geometry("460x300")
+    export_window.resizable(False, False)
+
+    frame = ttk.Frame(export_window, padding="15")
+    frame.pack(fill=tk.BOTH, expand=True)
+
+    origem_var = tk.StringVar(value='planilhas')
+    ttk.Label(frame, text="Origem dos dados:", font=("Arial", 10, "bold")).pack(anchor='w')
+    ttk.Radiobutton(frame, text="Todas as planilhas (todas as tipologias)", variable=origem_var, value='planilhas').pack(anchor='w')
+    ttk.Radiobutton(frame, text="Visualização atual da pesquisa (com filtro)", variable=origem_var, value='visualizacao').pack(anchor='w')
+
+    formato_var = tk.StringVar(value='xlsx')
+    ttk.Label(frame, text="Formato:", font=("Arial", 10, "bold")).pack(anchor='w', pady=(10, 0))
+    formatos_frame = ttk.Frame(frame)
+    formatos_frame.pack(anchor='w')
+    for formato in exportacao.formatos_disponiveis():
+        ttk.Radiobutton(formatos_frame, text=exportacao.FORMATOS[formato], variable=formato_var, value=formato).pack(side=tk.LEFT, padx=(0, 10))
+
+    progresso_bar = ttk.Progressbar(frame, mode='determinate', maximum=100)
+    progresso_bar.pack(fill=tk.X, pady=(15, 5))
+    status_label = ttk.Label(frame, text="")
+    status_label.pack(anchor='w')
+
+    botoes = ttk.Frame(frame)
+    botoes.pack(fill=tk.X, side=tk.BOTTOM)
+    cancelar_evento = threading.Event()
+
+    def iniciar():
+        formato = formato_var.get()
+        if origem_var.get() == 'visualizacao':
+            if df_visivel is None or df_visivel.empty:
+                messagebox.showwarning("Atenção", "Não há dados para exportar. Realize uma pesquisa ou clique em 'Mostrar Todos' primeiro.", parent=export_window)
+                return
+            fonte = exportacao.fonte_dataframe(df_visivel)
+        else:
+            try:
+                fonte = exportacao.fonte_planilhas()
+            except Exception as e:
+                messagebox.showerror("Erro", f"Não foi possível ler as planilhas.\n\nErro: {e}", parent=export_window)
+                return
+            if fonte[0] == 0:
+                messagebox.showwarning("Atenção", "Não há dados para exportar.", parent=export_window)
+                return
+        filename = f"biblioteca_geral.{formato}"
+        btn_exportar.config(state='disabled')
+        _exportar_em_segundo_plano(export_window, progresso_bar, status_label, cancelar_evento, fonte, filename, formato,
+                                   f"Planilha geral '{filename}' criada com sucesso!")
+
+    def cancelar():
+        if btn_exportar.instate(['disabled']):
+            cancelar_evento.set()
+            status_label.config(text="Cancelando...")
+        else:
+            export_window.destroy()
+
+    btn_exportar = ttk.Button(botoes, text="Exportar", command=iniciar)
+    btn_exportar.pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes, text="Cancelar", command=cancelar).pack(side=tk.RIGHT, padx=5)
+    export_window.protocol("WM_DELETE_WINDOW", cancelar)
 
-    filename = "biblioteca_geral.xlsx"
+def _abrir_planilha_consolidada(tipologia, filename):
+    """Gera em segundo plano a cópia consolidada (somente leitura) de uma tipologia particionada e a abre."""
     try:
-        # Garante que todos os campos existam e estejam na ordem padronizada
-        df_export = df_global.copy()
-        for col in all_columns:
-            if col not in df_export.columns:
-                df_export[col] = ""
-        df_export = df_export[all_columns]
-        # Garante que 'Registro' seja texto para preservar zeros
-        if 'Registro' in df_export.columns:
-            df_export['Registro'] = df_export['Registro'].astype(str)
-        df_export.to_excel(filename, index=False)
-        messagebox.showinfo("Sucesso", f"Planilha geral '{filename}' criada com sucesso!")
-        if os.name == 'nt': os.startfile(filename)
-        else: subprocess.call(('open' if sys.platform == 'darwin' else 'xdg-open', filename))
+        fonte = exportacao.fonte_planilhas(selecao=[tipologia])
     except Exception as e:
-        messagebox.showerror("Erro ao Gerar Planilha", f"Não foi possível criar ou abrir a planilha geral.\n\nErro: {e}")
+        messagebox.showerror("Erro", f"Não foi possível ler os segmentos de '{tipologia}'.\n\nErro: {e}")
+        return
+    janela = tk.Toplevel(app)
+    janela.title("Ver Planilha Excel Individual")
+    janela.geometry("460x170")
+    janela.resizable(False, False)
+    frame = ttk.Frame(janela, padding="15")
+    frame.pack(fill=tk.BOTH, expand=True)
+    ttk.Label(frame, text=f"'{tipologia}' está dividida em segmentos. Será aberta uma cópia consolidada;\nalterações feitas nela não são salvas no catálogo.").pack(anchor='w')
+    progresso_bar = ttk.Progressbar(frame, mode='determinate', maximum=100)
+    progresso_bar.pack(fill=tk.X, pady=(15, 5))
+    status_label = ttk.Label(frame, text="")
+    status_label.pack(anchor='w')
+    cancelar_evento = threading.Event()
+
+    def cancelar():
+        cancelar_evento.set()
+        status_label.config(text="Cancelando...")
+
+    ttk.Button(frame, text="Cancelar", command=cancelar).pack(side=tk.RIGHT, pady=(10, 0))
+    janela.protocol("WM_DELETE_WINDOW", cancelar)
+    _exportar_em_segundo_plano(janela, progresso_bar, status_label, cancelar_evento, fonte, filename, 'xlsx', None)
 
 def abrir_planilha():
     """Abre a planilha correspondente à aba ativa."""
@@ -263,30 +284,21 @@ def abrir_planilha():
 
         filename = get_filename_for_tipologia(tipologia_ativa)
 
-        if not os.path.exists(filename):
+        if ler_manifesto(tipologia_ativa) is not None:
+            # Tipologia particionada: abre uma cópia consolidada (somente leitura) dos segmentos
+            _abrir_planilha_consolidada(tipologia_ativa, filename[:-len('.xlsx')] + '_consolidada.xlsx')
+            return
+        elif not os.path.exists(filename):
             messagebox.showwarning("Atenção", f"Nenhum dado foi salvo para '{tipologia_ativa}' ainda. O arquivo '{filename}' não existe.")
             return
-        # Normaliza a estrutura da planilha para conter todas as colunas (inclui 'Número') na ordem correta
-        try:
-            df_local_open = pd.read_excel(filename)
-            # Normaliza nomes de colunas
-            df_local_open.columns = [str(c).strip() for c in df_local_open.columns]
-            changed = False
-            for col in all_columns:
-                if col not in df_local_open.columns:
-                    df_local_open[col] = ""
-                    changed = True
-            # Reordena colunas se necessário
-            if list(df_local_open.columns) != all_columns:
-                df_local_open = df_local_open[all_columns]
-                changed = True
-            if changed:
-                df_local_open.to_excel(filename, index=False)
-        except Exception as e:
-            print(f"AVISO: Falha ao normalizar planilha '{filename}': {e}")
+        else:
+            # Normaliza a estrutura da planilha para conter todas as colunas (inclui 'Número') na ordem correta
+            try:
+                normalizar_planilha(filename)
+            except Exception as e:
+                print(f"AVISO: Falha ao normalizar planilha '{filename}': {e}")
 
-        if os.name == 'nt': os.startfile(filename)
-        else: subprocess.call(('open' if sys.platform == 'darwin' else 'xdg-open', filename))
+        _abrir_arquivo(filename)
     except Exception as e:
         messagebox.showerror("Erro", f"Não foi possível abrir o arquivo.\n{e}")
 
@@ -296,99 +308,183 @@ def normalizar_planilhas_existentes():
     """
     try:
         for tip in tipologias:
-            filename = get_filename_for_tipologia(tip)
-            if not os.path.exists(filename):
-                continue
-            try:
-                df_local = pd.read_excel(filename, dtype={'Registro': str})
-                # Normaliza nomes de colunas
-                df_local.columns = [str(c).strip() for c in df_local.columns]
-                changed = False
-                for col in all_columns:
-                    if col not in df_local.columns:
-                        df_local[col] = ""
-                        changed = True
-                # Reordena colunas se necessário
-                if list(df_local.columns) != all_columns:
-                    df_local = df_local[all_columns]
-                    changed = True
-                # Garante tipo texto em Registro
-                if 'Registro' in df_local.columns:
-                    df_local['Registro'] = df_local['Registro'].astype(str)
-                if changed:
-                    df_local.to_excel(filename, index=False)
-            except Exception as e:
-                print(f"AVISO: Falha ao normalizar '{filename}': {e}")
+            for filename in arquivos_da_tipologia(tip):
+                try:
+                    normalizar_planilha(filename, trava=get_filename_for_tipologia(tip))
+                except Exception as e:
+                    print(f"AVISO: Falha ao normalizar '{filename}': {e}")
     except Exception as e:
         print(f"AVISO: Erro geral na normalização: {e}")
 
+@diagnostico.acao('atualizar_visualizacao_pesquisa')
 def atualizar_visualizacao_pesquisa(df_filtrado=None):
     """Carrega todos os dados de todas as planilhas, os combina e exibe na tabela."""
-    global df_global
+    global df_global, df_visivel, catalogo_carregado, termo_filtro_atual, consulta_estante
     
     # Se um DataFrame filtrado for fornecido, use-o. Caso contrário, recarregue tudo.
     if df_filtrado is None:
-        todos_os_dfs = []
-        for tipologia in tipologias:
-            filename = get_filename_for_tipologia(tipologia)
-            if os.path.exists(filename):
-                try:
-                    df_temp = pd.read_excel(filename, dtype={'Registro': str})
-                    # Normaliza nomes de colunas
-                    df_temp.columns = [str(c).strip() for c in df_temp.columns]
-                    # Garante que todas as colunas existam e ordem padronizada
-                    for col in all_columns:
-                        if col not in df_temp.columns:
-                            df_temp[col] = ""
-                    df_temp = df_temp[all_columns]
-                    todos_os_dfs.append(df_temp)
-                except Exception as e:
-                    print(f"Erro ao ler {filename}: {e}")
-        
-        if todos_os_dfs:
-            df_global = pd.concat(todos_os_dfs, ignore_index=True)
-            # Reforça ordenação das colunas
-            df_global = df_global[all_columns]
-        else:
-            df_global = pd.DataFrame(columns=all_columns)
+        df_global = carregar_catalogo()
+        catalogo_carregado = True
+        termo_filtro_atual = ""
+        consulta_estante = None
+        # Depois de construído, o índice é mantido pelas gravações e recargas de cada tipologia
+        if not indice_estante.construido:
+            indice_estante.construir(df_global)
 
     # Limpa a visualização antiga
-    for item in result_tree.get_children():
-        result_tree.delete(item)
+    with diagnostico.medir('treeview.limpar'):
+        for item in result_tree.get_children():
+            result_tree.delete(item)
+    itens_por_tipologia.clear()
 
     df_para_mostrar = df_filtrado if df_filtrado is not None else df_global
-    # Garante que todas as colunas existam e na ordem correta, mesmo em arquivos antigos sem 'Número'
-    if df_para_mostrar is not None and not df_para_mostrar.empty:
-        for col in all_columns:
-            if col not in df_para_mostrar.columns:
-                df_para_mostrar[col] = ""
-        df_para_mostrar = df_para_mostrar[all_columns]
-    
-    if df_para_mostrar is not None and not df_para_mostrar.empty:
-        # Evita exibir 'nan' e formata campos numéricos para inteiros quando aplicável
-        df_temp = df_para_mostrar.copy()
-        # Formatação para campos inteiros desejados (Exemplar não é formatado como número)
-        for campo_int in ['Número', 'Volume', 'Ano', 'Quantidade']:
-            if campo_int in df_temp.columns:
-                df_temp[campo_int] = df_temp[campo_int].apply(_format_numero_for_display)
-        df_temp = df_temp.fillna("").astype(str)
+    df_visivel = df_para_mostrar
+    _inserir_linhas(preparar_exibicao(df_para_mostrar))
+
+def _inserir_linhas(df_temp, posicao=tk.END):
+    """Insere as linhas já formatadas na Treeview, a partir de 'posicao'."""
+    with diagnostico.medir('treeview.inserir'):
         for index, row in df_temp.iterrows():
-            result_tree.insert('', tk.END, values=list(row))
+            item = result_tree.insert('', posicao, values=list(row))
+            itens_por_tipologia.setdefault(row['Tipologia'], []).append(item)
+            if posicao != tk.END:
+                posicao += 1
+    diagnostico.contar('treeview.linhas_inseridas', len(df_temp))
+
+def _ao_alterar_planilha(caminho):
+    """Executado na thread do monitor: relê somente a planilha alterada externamente."""
+    tipologia = arquivos_monitorados.get(caminho)
+    if tipologia is None:
+        return
+    if caminho.endswith('.manifest.json'):
+        _atualizar_arquivos_monitorados(caminho)
+    try:
+        with diagnostico.medir('monitor.recarregar', caminho):
+            df_tipologia = carregar_tipologia(tipologia)
+        fila_recargas.put((tipologia, df_tipologia, None))
+    except Exception as e:
+        fila_recargas.put((tipologia, None, e))
+
+def _atualizar_arquivos_monitorados(caminho):
+    """Passa a observar os segmentos novos quando o manifesto de uma tipologia particionada muda."""
+    global arquivos_monitorados
+    if caminho.endswith('.manifest.json'):
+        arquivos_monitorados = monitor_arquivos.arquivos_tipologias()
+
+def _processar_recargas():
+    """Aplica na interface as planilhas relidas pelo monitor (Tk só pode ser usado nesta thread)."""
+    try:
+        while True:
+            tipologia, df_tipologia, erro = fila_recargas.get_nowait()
+            if erro is not None:
+                print(f"AVISO: Falha ao recarregar '{tipologia}': {erro}")
+                continue
+            _aplicar_recarga(tipologia, df_tipologia)
+    except queue.Empty:
+        pass
+    app.after(500, _processar_recargas)
+
+def _aplicar_recarga(tipologia, df_tipologia):
+    """Troca apenas as linhas da tipologia em memória e na tabela, mantendo o filtro atual."""
+    global df_global, df_visivel
+    if indice_estante.construido:
+        indice_estante.substituir_tipologia(tipologia, df_tipologia)
+    if catalogo_carregado and consulta_estante is not None:
+        # A ordem de estante intercala tipologias: refaz a consulta no índice atualizado
+        df_global = substituir_tipologia(df_global, tipologia, df_tipologia)
+        _mostrar_estante(*consulta_estante)
+        status_pesquisa_label.config(text=f"'{tipologia}' recarregada após alteração externa ({datetime.now():%H:%M:%S}).")
+    elif catalogo_carregado:
+        df_global = substituir_tipologia(df_global, tipologia, df_tipologia)
+        novos_visiveis = filtrar_catalogo(df_tipologia, termo_filtro_atual)
+        df_visivel = substituir_tipologia(df_visivel, tipologia, novos_visiveis)
+        itens = itens_por_tipologia.pop(tipologia, [])
+        posicao = result_tree.index(itens[0]) if itens else tk.END
+        if itens:
+            result_tree.delete(*itens)
+        _inserir_linhas(preparar_exibicao(novos_visiveis), posicao)
+        status_pesquisa_label.config(text=f"'{tipologia}' recarregada após alteração externa ({datetime.now():%H:%M:%S}).")
+    if indice_sugestoes.construido:
+        _agendar_sugestoes(tipologia, df_tipologia)
+    _verificar_conflitos_edicao(tipologia, df_tipologia)
+
+def _agendar_sugestoes(tipologia, df_tipologia):
+    """Guarda a versão mais recente da tipologia e inicia a thread das sugestões, se parada.
+    Recargas seguidas da mesma tipologia substituem a pendente, de modo que uma versão antiga
+    nunca é aplicada depois de uma mais nova.
+    """
+    with sugestoes_pendentes['lock']:
+        sugestoes_pendentes['tipologias'][tipologia] = df_tipologia
+        if sugestoes_pendentes['trabalhando']:
+            return
+        sugestoes_pendentes['trabalhando'] = True
+    threading.Thread(target=_recarregar_sugestoes, daemon=True).start()
+
+def _recarregar_sugestoes():
+    """Executado numa thread: refaz as sugestões com as tipologias recarregadas sem travar a interface."""
+    while True:
+        with sugestoes_pendentes['lock']:
+            if not sugestoes_pendentes['tipologias']:
+                sugestoes_pendentes['trabalhando'] = False
+                return
+            tipologia, df_tipologia = sugestoes_pendentes['tipologias'].popitem()
+        try:
+            indice_sugestoes.substituir_tipologia(tipologia, df_tipologia)
+        except Exception as e:
+            print(f"AVISO: Não foi possível atualizar as sugestões de '{tipologia}': {e}")
+
+def _verificar_conflitos_edicao(tipologia, df_tipologia):
+    """Avisa as janelas de edição abertas cujo registro mudou fora do sistema."""
+    for (tip, registro), edicao in list(edicoes_abertas.items()):
+        if tip != tipologia:
+            continue
+        linhas = df_tipologia[df_tipologia['Registro'].astype(str) == str(registro)]
+        if linhas.empty:
+            motivo = "foi excluído"
+        else:
+            atuais = preparar_exibicao(linhas).iloc[0]
+            if all(str(atuais[col]) == str(edicao['valores'].get(col, '')) for col in all_columns):
+                continue
+            motivo = "foi alterado"
+        messagebox.showwarning("Conflito de edição", f"O registro {registro} ({tip}) {motivo} fora do sistema enquanto esta janela estava aberta.\nAo salvar, os campos alterados dos dois lados serão confirmados antes de sobrescrever.", parent=edicao['janela'])
 
+@diagnostico.acao('buscar_registro')
 def buscar_registro():
     """Filtra o DataFrame em memória e atualiza a visualização."""
+    global termo_filtro_atual, consulta_estante
     termo_busca = search_entry.get().strip().lower()
     if not termo_busca:
         atualizar_visualizacao_pesquisa()
         return
     if df_global is None or df_global.empty: return
     # Filtra por Registro, Autor ou Título
-    registro_match = df_global['Registro'].fillna("").astype(str).str.lower().str.contains(termo_busca, na=False)
-    autor_match = df_global['Autor'].fillna("").astype(str).str.lower().str.contains(termo_busca, na=False)
-    titulo_match = df_global['Título'].fillna("").astype(str).str.lower().str.contains(termo_busca, na=False)
-    df_filtrado = df_global[registro_match | autor_match | titulo_match]
+    termo_filtro_atual = termo_busca
+    consulta_estante = None
+    df_filtrado = filtrar_catalogo(df_global, termo_busca)
     atualizar_visualizacao_pesquisa(df_filtrado)
 
+@diagnostico.acao('listar_estante')
+def listar_estante():
+    """Mostra, em ordem de estante, os registros sob uma CDU ou entre duas classificações."""
+    if not catalogo_carregado:
+        atualizar_visualizacao_pesquisa()
+    total = _mostrar_estante(cdu_inicio_entry.get().strip(), cdu_fim_entry.get().strip())
+    status_pesquisa_label.config(text=f"{total} registro(s) em ordem de estante.")
+
+def _mostrar_estante(inicio, fim):
+    """Exibe a consulta de estante e a guarda para ser refeita nas recargas. Retorna o total."""
+    global termo_filtro_atual, consulta_estante
+    if inicio and not fim:
+        pares = indice_estante.subarvore(inicio)
+    elif inicio or fim:
+        pares = indice_estante.intervalo(inicio, fim)
+    else:
+        pares = indice_estante.ordem_estante()
+    termo_filtro_atual = ""
+    consulta_estante = (inicio, fim)
+    atualizar_visualizacao_pesquisa(indice_cdu.selecionar(df_global, pares))
+    return len(pares)
+
 def excluir_registro():
     """Exclui o registro selecionado do arquivo de planilha correto."""
     selected_item = result_tree.focus()
@@ -405,19 +501,14 @@ def excluir_registro():
     confirm = messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir o registro?\n\nRegistro: {registro_para_excluir}\nAutor: {autor}\nTipologia: {tipologia_do_registro}")
     if confirm:
         filename = get_filename_for_tipologia(tipologia_do_registro)
-        if not os.path.exists(filename):
-            messagebox.showerror("Erro", f"Arquivo de origem '{filename}' não encontrado!")
-            return
-        
         try:
-            df_local = pd.read_excel(filename, dtype={'Registro': str})
-            # Normaliza nomes de colunas
-            df_local.columns = [str(c).strip() for c in df_local.columns]
-            df_local = df_local[df_local['Registro'].astype(str) != str(registro_para_excluir)]
-            df_local.to_excel(filename, index=False)
+            with diagnostico.acao('excluir_registro'):
+                remover_registro(tipologia_do_registro, registro_para_excluir)
+                # Recarrega a visualização da pesquisa para refletir a exclusão
+                atualizar_visualizacao_pesquisa()
             messagebox.showinfo("Sucesso", "Registro excluído com sucesso.")
-            # Recarrega a visualização da pesquisa para refletir a exclusão
-            atualizar_visualizacao_pesquisa()
+        except CatalogoError as e:
+            messagebox.showerror("Erro", str(e))
         except Exception as e:
             messagebox.showerror("Erro ao Salvar", f"Não foi possível salvar as alterações no arquivo '{filename}'.\n\nErro: {e}")
 
@@ -434,6 +525,15 @@ def editar_registro():
     edit_window.title("Editar Registro")
     edit_window.geometry("700x600")
 
+    # Registra a edição em andamento para detectar alterações externas no mesmo registro
+    chave_edicao = (item_values.get('Tipologia'), item_values.get('Registro'))
+    edicoes_abertas[chave_edicao] = {'valores': item_values, 'janela': edit_window}
+
+    def _ao_fechar_edicao(event):
+        if event.widget is edit_window:
+            edicoes_abertas.pop(chave_edicao, None)
+    edit_window.bind('<Destroy>', _ao_fechar_edicao)
+
     edit_entries = []
     # Exibe 'Registro' como somente leitura para manter a sequência
     i = 0
@@ -496,6 +596,9 @@ def editar_registro():
                 vcmd_edit = (edit_window.register(_validate_numero_edit), '%d', '%P')
                 entry.configure(validate='key', validatecommand=vcmd_edit)
 
+            if key in autocompletar.CAMPOS_AUTOCOMPLETAR:
+                ativar_autocompletar(entry, key)
+
             edit_entries.append({'label': key, 'widget': entry})
             i += 1
     
@@ -524,100 +627,27 @@ def editar_registro():
             messagebox.showwarning("Atenção", "Formato de data inválido. Use DD/MM/AAAA.", parent=edit_window)
             return
 
-        # Normaliza campo 'Número'
-        if 'Número' in novos_dados:
-            novos_dados['Número'] = _normalize_numero_value(novos_dados.get('Número', ''))
-
-        # Normaliza campos numéricos inteiros adicionais na edição (Exemplar tratado como texto livre)
-        for campo_int in ['Volume', 'Ano', 'Quantidade']:
-            if campo_int in novos_dados:
-                novos_dados[campo_int] = _normalize_int_field(novos_dados.get(campo_int, ''))
-
         original_registro = item_values.get('Registro')
         original_tipologia = item_values.get('Tipologia')
-        # Registro não é editável: mantém o original
-        novo_registro = original_registro
-        nova_tipologia = novos_dados['Tipologia']
 
         try:
-            # Carrega e normaliza o arquivo de origem (onde o registro foi encontrado originalmente)
-            filename_origem = get_filename_for_tipologia(original_tipologia)
-            if not os.path.exists(filename_origem):
-                messagebox.showerror("Erro", f"Arquivo de origem '{filename_origem}' não encontrado!", parent=edit_window)
-                return
-            df_origem = pd.read_excel(filename_origem, dtype={'Registro': str})
-            # Normaliza nomes de colunas
-            df_origem.columns = [str(c).strip() for c in df_origem.columns]
-            for col in all_columns:
-                if col not in df_origem.columns:
-                    df_origem[col] = ""
-            # Localiza pelo Registro original
-            idx = df_origem[df_origem['Registro'].astype(str) == str(original_registro)].index
-            if idx.empty:
-                messagebox.showerror("Erro", f"Registro '{original_registro}' não encontrado em '{filename_origem}'.", parent=edit_window)
-                return
-
-            # Mantém o 'Registro' como está, não permitindo alteração manual
-            novos_dados['Registro'] = original_registro
-
-            # Se a tipologia não mudou, atualiza no mesmo arquivo
-            if nova_tipologia == original_tipologia:
-                # Atualiza todos os campos, exceto 'Registro'
-                for col, val in novos_dados.items():
-                    if col == 'Registro':
-                        continue
-                    df_origem.loc[idx, col] = val
-                df_origem = df_origem[all_columns]
-                if 'Registro' in df_origem.columns:
-                    df_origem['Registro'] = df_origem['Registro'].astype(str)
-                df_origem.to_excel(filename_origem, index=False)
-            else:
-                # Move o registro: remove do arquivo de origem e adiciona no destino
-                registro_atualizado_dict = df_origem.loc[idx].iloc[0].to_dict()
-                # Aplica novos valores editados
-                for col, val in novos_dados.items():
-                    if col == 'Registro':
-                        continue
-                    registro_atualizado_dict[col] = val
-                # Remove do arquivo de origem
-                df_origem = df_origem.drop(idx)
-                df_origem = df_origem[all_columns]
-                if 'Registro' in df_origem.columns:
-                    df_origem['Registro'] = df_origem['Registro'].astype(str)
-                df_origem.to_excel(filename_origem, index=False)
-
-                # Adiciona no arquivo de destino
-                filename_destino = get_filename_for_tipologia(nova_tipologia)
-                if os.path.exists(filename_destino):
-                    df_destino = pd.read_excel(filename_destino, dtype={'Registro': str})
-                    # Normaliza nomes de colunas
-                    df_destino.columns = [str(c).strip() for c in df_destino.columns]
-                else:
-                    df_destino = pd.DataFrame(columns=all_columns)
-                for col in all_columns:
-                    if col not in df_destino.columns:
-                        df_destino[col] = ""
-                # Mantém o 'Registro' original; se duplicado no destino, impede a movimentação
-                if 'Registro' in df_destino.columns and not df_destino.empty:
-                    if str(original_registro) in df_destino['Registro'].astype(str).tolist():
-                        messagebox.showerror("Erro", f"O Registro '{original_registro}' já existe na planilha {filename_destino}! Não é possível mover mantendo a sequência.")
-                        return
-                # Converte o dicionário atualizado para DataFrame e concatena
-                registro_df = pd.DataFrame([registro_atualizado_dict])
-                # Garante todas as colunas e ordem
-                for col in all_columns:
-                    if col not in registro_df.columns:
-                        registro_df[col] = ""
-                registro_df = registro_df[all_columns]
-                df_destino = pd.concat([df_destino, registro_df], ignore_index=True)
-                df_destino = df_destino[all_columns]
-                if 'Registro' in df_destino.columns:
-                    df_destino['Registro'] = df_destino['Registro'].astype(str)
-                df_destino.to_excel(filename_destino, index=False)
-
+            # Registro não é editável: mantém o original. Alterações feitas por outra
+            # estação desde que a janela foi aberta são mescladas campo a campo.
+            # O span da ação cobre só o trabalho, não o tempo dos diálogos
+            try:
+                with diagnostico.acao('salvar_edicao'):
+                    atualizar_registro(original_tipologia, original_registro, novos_dados, originais=item_values)
+                    atualizar_visualizacao_pesquisa()
+            except ConflitoEdicaoError as e:
+                if not messagebox.askyesno("Conflito de edição", f"{e}\n\nDeseja sobrescrever esses campos com os valores desta janela?", parent=edit_window):
+                    return
+                with diagnostico.acao('salvar_edicao'):
+                    atualizar_registro(original_tipologia, original_registro, novos_dados, originais=item_values, forcar=True)
+                    atualizar_visualizacao_pesquisa()
             messagebox.showinfo("Sucesso", "Alteração realizada com sucesso.", parent=edit_window)
             edit_window.destroy()
-            atualizar_visualizacao_pesquisa()
+        except CatalogoError as e:
+            messagebox.showerror("Erro", str(e), parent=edit_window)
         except Exception as e:
             messagebox.showerror("Erro ao Salvar", f"Não foi possível salvar as alterações.\n\nErro: {e}", parent=edit_window)
 
@@ -658,6 +688,371 @@ def ver_registro_individual():
     close_button = ttk.Button(footer, text="Fechar", command=view_window.destroy)
     close_button.pack(side=tk.RIGHT)
 
+def abrir_diagnostico(event=None):
+    """Janela oculta (Ctrl+Shift+D) com os tempos medidos em cada fase das operações."""
+    diag_window = tk.Toplevel(app)
+    diag_window.title("Diagnóstico de Desempenho")
+    diag_window.geometry("900x600")
+
+    colunas = ['Span', 'Contagem', 'Total (s)', 'Média (ms)', 'p50 (ms)', 'p95 (ms)', 'Máx (ms)']
+    spans_tree = ttk.Treeview(diag_window, columns=colunas, show='headings', height=12)
+    for col in colunas:
+        spans_tree.heading(col, text=col)
+        spans_tree.column(col, width=260 if col == 'Span' else 90, anchor='w' if col == 'Span' else 'e')
+    spans_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    detalhe_text = tk.Text(diag_window, height=12, font=("Courier New", 9))
+    detalhe_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    perfil_var = tk.BooleanVar(value=diagnostico.perfil_armado())
+    spans_por_nome = {}
+
+    def _ms(valor):
+        return "" if valor is None else f"{valor * 1000:.1f}"
+
+    def _mostrar_texto(texto):
+        detalhe_text.delete("1.0", tk.END)
+        detalhe_text.insert("1.0", texto)
+
+    def atualizar():
+        spans, contadores = diagnostico.resumo()
+        spans_por_nome.clear()
+        for item in spans_tree.get_children():
+            spans_tree.delete(item)
+        for span in spans:
+            spans_por_nome[span['nome']] = span
+            spans_tree.insert('', tk.END, iid=span['nome'], values=[
+                span['nome'], span['contagem'], f"{span['total_s']:.3f}", _ms(span['media_s']),
+                _ms(span['p50_s']), _ms(span['p95_s']), _ms(span['max_s'])])
+        linhas = [f"{nome}: {valor}" for nome, valor in sorted(contadores.items())]
+        if diagnostico.ultimo_perfil:
+            linhas.append("")
+            linhas.append(f"Último perfil ({diagnostico.ultimo_perfil['acao']}): {diagnostico.ultimo_perfil['arquivo']}")
+            linhas.append(diagnostico.ultimo_perfil['texto'])
+        _mostrar_texto("\n".join(linhas))
+        perfil_var.set(diagnostico.perfil_armado())
+
+    def mostrar_histograma(event):
+        selecionado = spans_tree.focus()
+        span = spans_por_nome.get(selecionado)
+        if not span:
+            return
+        limites = [f"<= {l} ms" for l in diagnostico.LIMITES_HISTOGRAMA_MS] + [f"> {diagnostico.LIMITES_HISTOGRAMA_MS[-1]} ms"]
+        maior = max(span['histograma']) or 1
+        linhas = [f"Histograma de '{span['nome']}'"]
+        for faixa, qtd in zip(limites, span['histograma']):
+            linhas.append(f"{faixa:>12} | {'#' * int(40 * qtd / maior):<40} {qtd}")
+        _mostrar_texto("\n".join(linhas))
+
+    def exportar(formato):
+        caminho = filedialog.asksaveasfilename(parent=diag_window, defaultextension=f".{formato}",
+                                               filetypes=[(formato.upper(), f"*.{formato}")],
+                                               initialfile=f"diagnostico.{formato}")
+        if not caminho:
+            return
+        try:
+            if formato == 'json':
+                diagnostico.exportar_json(caminho)
+            else:
+                diagnostico.exportar_csv(caminho)
+            messagebox.showinfo("Sucesso", f"Diagnóstico exportado para '{caminho}'.", parent=diag_window)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Não foi possível exportar o diagnóstico.\n\nErro: {e}", parent=diag_window)
+
+    def alternar_perfil():
+        if perfil_var.get():
+            diagnostico.armar_perfil()
+        else:
+            diagnostico.limpar_perfil_armado()
+
+    def limpar():
+        diagnostico.limpar()
+        atualizar()
+
+    spans_tree.bind('<<TreeviewSelect>>', mostrar_histograma)
+
+    botoes = ttk.Frame(diag_window, padding=(10, 5))
+    botoes.pack(fill=tk.X)
+    ttk.Button(botoes, text="Atualizar", command=atualizar).pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes, text="Exportar JSON", command=lambda: exportar('json')).pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes, text="Exportar CSV", command=lambda: exportar('csv')).pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes, text="Limpar", command=limpar).pack(side=tk.LEFT, padx=5)
+    ttk.Checkbutton(botoes, text="Perfilar a próxima ação (cProfile)", variable=perfil_var,
+                    command=alternar_perfil).pack(side=tk.LEFT, padx=15)
+    ttk.Button(botoes, text="Fechar", command=diag_window.destroy).pack(side=tk.RIGHT, padx=5)
+
+    atualizar()
+
+def abrir_backups():
+    """Lista as cópias de segurança e restaura uma tipologia como estava em uma delas."""
+    backup_window = tk.Toplevel(app)
+    backup_window.title("Cópias de Segurança")
+    backup_window.geometry("520x420")
+    backup_window.transient(app)
+
+    frame = ttk.Frame(backup_window, padding=15)
+    frame.pack(fill=tk.BOTH, expand=True)
+
+    ttk.Label(frame, text="Tipologia:", font=("Arial", 10, "bold")).pack(anchor='w')
+    tipologia_var = tk.StringVar(value=tipologias[0])
+    tipologia_combo = ttk.Combobox(frame, textvariable=tipologia_var, values=tipologias, state='readonly')
+    tipologia_combo.pack(anchor='w', pady=(0, 10))
+
+    ttk.Label(frame, text="Cópias disponíveis:", font=("Arial", 10, "bold")).pack(anchor='w')
+    copias_list = tk.Listbox(frame, height=12)
+    copias_list.pack(fill=tk.BOTH, expand=True)
+    status_label = ttk.Label(frame, text="")
+    status_label.pack(anchor='w', pady=5)
+
+    botoes = ttk.Frame(frame)
+    botoes.pack(fill=tk.X, side=tk.BOTTOM)
+    identificadores = []
+    mensagens = queue.Queue()
+
+    def listar(event=None):
+        copias_list.delete(0, tk.END)
+        identificadores.clear()
+        tipologia = tipologia_var.get()
+        # Mais recentes primeiro
+        for identificador in reversed(backup.listar_instantaneos()):
+            try:
+                instantaneo = backup.ler_instantaneo(identificador)
+            except Exception as e:
+                print(f"AVISO: Cópia de segurança '{identificador}' ilegível: {e}")
+                continue
+            entrada = instantaneo['tipologias'].get(tipologia)
+            linhas = entrada['linhas'] if entrada else 0
+            alterada = " (alterada)" if tipologia in instantaneo.get('alteradas', []) else ""
+            data = datetime.strptime(identificador, '%Y%m%d-%H%M%S-%f')
+            copias_list.insert(tk.END, f"{data:%d/%m/%Y %H:%M:%S}  -  {linhas} registros{alterada}")
+            identificadores.append(identificador)
+        if not identificadores:
+            status_label.config(text="Nenhuma cópia de segurança foi feita ainda.")
+
+    def _trabalho(tipologia, identificador):
+        try:
+            if identificador is None:
+                mensagens.put(('copia', backup.criar_instantaneo(), None))
+            else:
+                backup.restaurar_tipologia(tipologia, identificador)
+                mensagens.put(('restaurado', tipologia, carregar_tipologia(tipologia)))
+        except Exception as e:
+            mensagens.put(('erro', e, None))
+
+    def _acompanhar():
+        try:
+            msg = mensagens.get_nowait()
+        except queue.Empty:
+            backup_window.after(100, _acompanhar)
+            return
+        for botao in (btn_copiar, btn_restaurar):
+            botao.config(state='normal')
+        if msg[0] == 'copia':
+            status_label.config(text="Cópia criada." if msg[1] else "Nada mudou desde a última cópia.")
+            listar()
+        elif msg[0] == 'restaurado':
+            _aplicar_recarga(msg[1], msg[2])
+            status_label.config(text=f"'{msg[1]}' restaurada ({len(msg[2])} registros).")
+            listar()
+        else:
+            status_label.config(text="")
+            messagebox.showerror("Erro", f"Não foi possível concluir a operação.\n\nErro: {msg[1]}", parent=backup_window)
+
+    def _iniciar(tipologia, identificador, texto):
+        for botao in (btn_copiar, btn_restaurar):
+            botao.config(state='disabled')
+        status_label.config(text=texto)
+        threading.Thread(target=_trabalho, args=(tipologia, identificador), daemon=True).start()
+        _acompanhar()
+
+    def restaurar():
+        selecao = copias_list.curselection()
+        if not selecao:
+            messagebox.showwarning("Atenção", "Selecione uma cópia para restaurar.", parent=backup_window)
+            return
+        tipologia = tipologia_var.get()
+        descricao = copias_list.get(selecao[0]).split('  -  ')[0]
+        if not messagebox.askyesno("Confirmar Restauração", f"Substituir todos os registros de '{tipologia}' pelos da cópia de {descricao}?\n\nO estado atual será guardado numa nova cópia antes da restauração.", parent=backup_window):
+            return
+        _iniciar(tipologia, identificadores[selecao[0]], "Restaurando...")
+
+    tipologia_combo.bind('<<ComboboxSelected>>', listar)
+    btn_copiar = ttk.Button(botoes, text="Fazer Cópia Agora", command=lambda: _iniciar(None, None, "Copiando..."))
+    btn_copiar.pack(side=tk.LEFT, padx=5)
+    btn_restaurar = ttk.Button(botoes, text="Restaurar", command=restaurar)
+    btn_restaurar.pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes, text="Fechar", command=backup_window.destroy).pack(side=tk.RIGHT, padx=5)
+    listar()
+
+def abrir_inventario():
+    """Modo inventário: registra lotes de 'Registro' lidos por localização e confere com o catálogo."""
+    inv_window = tk.Toplevel(app)
+    inv_window.title("Inventário")
+    inv_window.geometry("950x650")
+
+    sessao = {'atual': inventario.SessaoInventario(inventario.ultima_sessao() or inventario.caminho_nova_sessao())}
+    resultado = {'atual': None}
+    mensagens = queue.Queue()
+
+    topo = ttk.Frame(inv_window, padding=(10, 10, 10, 0))
+    topo.pack(fill=tk.X)
+    sessao_label = ttk.Label(topo, text="")
+    sessao_label.pack(side=tk.LEFT)
+
+    lote_frame = ttk.LabelFrame(inv_window, text="Lote lido", padding=10)
+    lote_frame.pack(fill=tk.X, padx=10, pady=5)
+    ttk.Label(lote_frame, text="Localização conferida:").grid(row=0, column=0, sticky='w', padx=5)
+    local_entry = ttk.Entry(lote_frame, width=30)
+    local_entry.grid(row=0, column=1, sticky='w', padx=5)
+    ativar_autocompletar(local_entry, 'Localização')
+    ttk.Label(lote_frame, text="Tipologia:").grid(row=0, column=2, sticky='w', padx=5)
+    tipologia_var = tk.StringVar(value="(todas)")
+    ttk.Combobox(lote_frame, textvariable=tipologia_var, values=["(todas)"] + tipologias, state='readonly', width=18).grid(row=0, column=3, sticky='w', padx=5)
+    ttk.Label(lote_frame, text="Registros (um por linha; leitor de código de barras ou colar):").grid(row=1, column=0, columnspan=4, sticky='w', padx=5, pady=(8, 0))
+    registros_text = tk.Text(lote_frame, height=6)
+    registros_text.grid(row=2, column=0, columnspan=4, sticky='ew', padx=5)
+    lote_frame.grid_columnconfigure(1, weight=1)
+
+    apenas_locais_var = tk.BooleanVar(value=True)
+    botoes_lote = ttk.Frame(lote_frame)
+    botoes_lote.grid(row=3, column=0, columnspan=4, sticky='ew', pady=(8, 0))
+
+    resumo_label = ttk.Label(inv_window, text="", font=("Arial", 10, "bold"))
+    resumo_label.pack(anchor='w', padx=10)
+    colunas = ['Situação', 'Tipologia', 'Registro', 'Localização cadastrada', 'Localização lida']
+    resultado_tree = ttk.Treeview(inv_window, columns=colunas, show='headings')
+    for col in colunas:
+        resultado_tree.heading(col, text=col)
+        resultado_tree.column(col, width=170, anchor='w')
+    resultado_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    def atualizar_sessao():
+        atual = sessao['atual']
+        sessao_label.config(text=f"Sessão: {os.path.basename(atual.caminho)}  -  {len(atual.lotes)} lote(s), {atual.total_leituras()} leitura(s)")
+
+    def registrar(registros):
+        local = local_entry.get().strip()
+        if not local:
+            messagebox.showwarning("Atenção", "Informe a localização conferida.", parent=inv_window)
+            return
+        if not registros:
+            messagebox.showwarning("Atenção", "Nenhum registro lido neste lote.", parent=inv_window)
+            return
+        tipologia = tipologia_var.get()
+        try:
+            sessao['atual'].registrar_lote(registros, local, None if tipologia == "(todas)" else tipologia)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Não foi possível gravar o lote.\n\nErro: {e}", parent=inv_window)
+            return
+        registros_text.delete("1.0", tk.END)
+        atualizar_sessao()
+
+    def carregar_arquivo():
+        caminho = filedialog.askopenfilename(parent=inv_window, title="Arquivo de registros lidos",
+                                             filetypes=[("Texto/CSV", "*.txt *.csv"), ("Todos os arquivos", "*.*")])
+        if caminho:
+            try:
+                registrar(inventario.ler_arquivo_registros(caminho))
+            except Exception as e:
+                messagebox.showerror("Erro", f"Não foi possível ler o arquivo.\n\nErro: {e}", parent=inv_window)
+
+    def nova_sessao():
+        if messagebox.askyesno("Nova Sessão", "Iniciar uma nova sessão de inventário? A sessão atual continua gravada e pode ser reaberta.", parent=inv_window):
+            sessao['atual'] = inventario.SessaoInventario(inventario.caminho_nova_sessao())
+            atualizar_sessao()
+
+    def abrir_sessao():
+        caminho = filedialog.askopenfilename(parent=inv_window, title="Abrir sessão de inventário",
+                                             initialdir=inventario.PASTA_INVENTARIO, filetypes=[("Sessão de inventário", "*.jsonl")])
+        if caminho:
+            sessao['atual'] = inventario.SessaoInventario(caminho)
+            atualizar_sessao()
+
+    def _trabalho(df, apenas_locais):
+        try:
+            if df is None:
+                df = carregar_catalogo()
+            mensagens.put(('fim', inventario.conciliar(df, sessao['atual'], apenas_locais)))
+        except Exception as e:
+            mensagens.put(('erro', e))
+
+    def _acompanhar():
+        try:
+            msg = mensagens.get_nowait()
+        except queue.Empty:
+            inv_window.after(100, _acompanhar)
+            return
+        btn_conciliar.config(state='normal')
+        if msg[0] == 'erro':
+            resumo_label.config(text="")
+            messagebox.showerror("Erro", f"Não foi possível conferir o inventário.\n\nErro: {msg[1]}", parent=inv_window)
+            return
+        res = msg[1]
+        resultado['atual'] = res
+        resumo_label.config(text=f"Encontrados {res['encontrados']} de {res['esperados']}  |  Faltando: {len(res['faltando'])}  |  "
+                                 f"Fora do lugar: {len(res['fora_do_lugar'])}  |  Desconhecidos: {len(res['desconhecidos'])}  |  Ambíguos: {len(res['ambiguos'])}")
+        resultado_tree.delete(*resultado_tree.get_children())
+        for n, linha in enumerate(inventario.linhas_relatorio(res)):
+            if n == LIMITE_LINHAS_INVENTARIO:
+                resultado_tree.insert('', tk.END, values=("...", "", "Exporte o relatório para ver todas as linhas", "", ""))
+                break
+            resultado_tree.insert('', tk.END, values=linha)
+
+    def conciliar():
+        if not sessao['atual'].lotes:
+            messagebox.showwarning("Atenção", "Nenhum lote foi registrado nesta sessão.", parent=inv_window)
+            return
+        btn_conciliar.config(state='disabled')
+        resumo_label.config(text="Conferindo...")
+        # Usa o catálogo já carregado na pesquisa, se houver; senão lê as planilhas na thread
+        df = df_global if catalogo_carregado else None
+        threading.Thread(target=_trabalho, args=(df, apenas_locais_var.get()), daemon=True).start()
+        _acompanhar()
+
+    def exportar():
+        if resultado['atual'] is None:
+            messagebox.showwarning("Atenção", "Confira o inventário antes de exportar o relatório.", parent=inv_window)
+            return
+        caminho = filedialog.asksaveasfilename(parent=inv_window, title="Exportar relatório", defaultextension=".csv",
+                                               initialfile=f"inventario_{datetime.now():%Y%m%d-%H%M%S}.csv",
+                                               filetypes=[("CSV", "*.csv")])
+        if caminho:
+            try:
+                inventario.exportar_relatorio(resultado['atual'], caminho)
+                messagebox.showinfo("Sucesso", f"Relatório gravado em '{caminho}'.", parent=inv_window)
+            except Exception as e:
+                messagebox.showerror("Erro", f"Não foi possível gravar o relatório.\n\nErro: {e}", parent=inv_window)
+
+    ttk.Button(botoes_lote, text="Registrar Lote", command=lambda: registrar(inventario.ler_registros(registros_text.get("1.0", tk.END)))).pack(side=tk.LEFT, padx=5)
+    ttk.Button(botoes_lote, text="Carregar Arquivo...", command=carregar_arquivo).pack(side=tk.LEFT, padx=5)
+    ttk.Checkbutton(botoes_lote, text="Faltando: só itens das localizações conferidas", variable=apenas_locais_var).pack(side=tk.LEFT, padx=15)
+    btn_conciliar = ttk.Button(botoes_lote, text="Conferir", command=conciliar)
+    btn_conciliar.pack(side=tk.RIGHT, padx=5)
+    ttk.Button(botoes_lote, text="Exportar Relatório", command=exportar).pack(side=tk.RIGHT, padx=5)
+    ttk.Button(topo, text="Abrir Sessão...", command=abrir_sessao).pack(side=tk.RIGHT, padx=5)
+    ttk.Button(topo, text="Nova Sessão", command=nova_sessao).pack(side=tk.RIGHT, padx=5)
+    atualizar_sessao()
+
+def fechar_aplicacao():
+    """Faz a última cópia de segurança em segundo plano e fecha a janela quando ela terminar."""
+    global encerrando
+    if not agendador_backup.ativo():
+        app.destroy()
+        return
+    if encerrando:
+        return
+    encerrando = True
+    agendador_backup.encerrar()
+    app.config(cursor='watch')
+    status_pesquisa_label.config(text="Salvando cópia de segurança antes de fechar...")
+
+    def _aguardar():
+        if agendador_backup.ativo():
+            app.after(100, _aguardar)
+        else:
+            app.destroy()
+    _aguardar()
+
 def ir_para_pesquisa():
     # Encontra a aba de pesquisa pelo texto para garantir que funcione após a reordenação
     for i, tab in enumerate(tab_control.tabs()):
@@ -672,14 +1067,94 @@ def on_tab_selected(event):
     if tab_text == "Pesquisar Tudo":
         atualizar_visualizacao_pesquisa()
 
-# --- DEFINIÇÕES DE LAYOUT ---
-campos_registro = [
-    'Data', 'Registro', 'Autor', 'Título', 'Local', 'Editora',
-    'Edição', 'Volume', 'Número', 'Ano', 'Exemplar', 'Quantidade', 'Origem',
-    'Cutter', 'Classificação - CDU', 'Assuntos', 'Localização'
-]
-tipologias = ['Livro', 'Folhetos', 'Multimeios', 'Periódicos', 'Plaquetes', 'Obras Raras', 'Folhetos de Cordel', 'Obra de Referência', 'Outros']
-all_columns = campos_registro + ['Tipologia', 'Observação'] # Definido globalmente
+def _construir_sugestoes():
+    """Executado numa thread ao iniciar: monta o índice do autocompletar sem travar a interface."""
+    try:
+        indice_sugestoes.construir(carregar_catalogo())
+    except Exception as e:
+        print(f"AVISO: Não foi possível montar as sugestões de preenchimento: {e}")
+
+def ativar_autocompletar(entry, campo):
+    """Mostra, abaixo do campo, os valores já usados que começam com o texto digitado.
+    Setas escolhem, Enter/Tab confirmam e Esc fecha. Em 'Assuntos' completa só a parte após o último ';'.
+    """
+    popup = {'janela': None, 'lista': None}
+    separador = autocompletar.SEPARADORES.get(campo)
+
+    def _partes():
+        texto = entry.get()
+        if separador and separador in texto:
+            corte = texto.rindex(separador) + 1
+            return texto[:corte] + ' ', texto[corte:]
+        return '', texto
+
+    def fechar(event=None):
+        if popup['janela'] is not None:
+            popup['janela'].destroy()
+            popup['janela'] = popup['lista'] = None
+
+    def confirmar(event=None):
+        lista = popup['lista']
+        if lista is None:
+            return None
+        selecao = lista.curselection()
+        if not selecao:
+            fechar()
+            return None
+        inicio, _ = _partes()
+        entry.delete(0, tk.END)
+        entry.insert(0, inicio + lista.get(selecao[0]))
+        entry.icursor(tk.END)
+        fechar()
+        return 'break'
+
+    def mover(passo):
+        lista = popup['lista']
+        if lista is None:
+            return None
+        selecao = lista.curselection()
+        atual = (selecao[0] + passo) if selecao else 0
+        atual = max(0, min(atual, lista.size() - 1))
+        lista.selection_clear(0, tk.END)
+        lista.selection_set(atual)
+        lista.see(atual)
+        return 'break'
+
+    def mostrar(sugestoes):
+        if popup['janela'] is None:
+            janela = tk.Toplevel(entry)
+            janela.wm_overrideredirect(True)
+            lista = tk.Listbox(janela, height=len(sugestoes), exportselection=False)
+            lista.pack(fill=tk.BOTH, expand=True)
+            lista.bind('<ButtonRelease-1>', confirmar)
+            popup['janela'], popup['lista'] = janela, lista
+        janela, lista = popup['janela'], popup['lista']
+        lista.delete(0, tk.END)
+        for sugestao in sugestoes:
+            lista.insert(tk.END, sugestao)
+        lista.config(height=len(sugestoes))
+        janela.geometry(f"{entry.winfo_width()}x{lista.winfo_reqheight()}+{entry.winfo_rootx()}+{entry.winfo_rooty() + entry.winfo_height()}")
+        janela.lift()
+
+    def ao_digitar(event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Tab', 'Escape', 'Shift_L', 'Shift_R', 'Control_L', 'Control_R'):
+            return
+        _, prefixo = _partes()
+        sugestoes = indice_sugestoes.sugerir(campo, prefixo)
+        # Não sugere o próprio texto já digitado por completo
+        if not sugestoes or (len(sugestoes) == 1 and autocompletar.chave_texto(sugestoes[0]) == autocompletar.chave_texto(prefixo)):
+            fechar()
+        else:
+            mostrar(sugestoes)
+
+    entry.bind('<KeyRelease>', ao_digitar, add='+')
+    entry.bind('<Down>', lambda e: mover(1))
+    entry.bind('<Up>', lambda e: mover(-1))
+    entry.bind('<Return>', confirmar)
+    entry.bind('<Tab>', confirmar)
+    entry.bind('<Escape>', fechar)
+    # Espera o clique na lista ser tratado antes de fechar
+    entry.bind('<FocusOut>', lambda e: entry.after(150, fechar))
 
 def create_registration_form(parent_tab, tipologia):
     """Cria um formulário de cadastro completo dentro de uma aba (parent_tab)."""
@@ -734,6 +1209,9 @@ def create_registration_form(parent_tab, tipologia):
             vcmd_int = (parent_tab.register(_validate_inteiro), '%d', '%P')
             entry.configure(validate='key', validatecommand=vcmd_int)
 
+        if campo_text in autocompletar.CAMPOS_AUTOCOMPLETAR:
+            ativar_autocompletar(entry, campo_text)
+
         entries.append({'label': campo_text, 'widget': entry})
 
     registro_frame.grid_columnconfigure(1, weight=1)
@@ -774,6 +1252,9 @@ app.configure(bg='white') # Define um fundo branco para a janela principal
 if not _license_valid():
     _request_activation(app)
 
+# Janela oculta de diagnóstico de desempenho
+app.bind_all('<Control-Shift-D>', abrir_diagnostico)
+
 # --- CABEÇALHO ---
 header_frame = tk.Frame(app, bg='#ff6666')
 header_frame.pack(side=tk.TOP, fill=tk.X)
@@ -854,6 +1335,20 @@ search_button.pack(side=tk.LEFT, padx=10)
 show_all_button = ttk.Button(search_frame, text="Mostrar Todos", command=atualizar_visualizacao_pesquisa)
 show_all_button.pack(side=tk.LEFT, padx=10)
 
+# Consulta por número de chamada: só 'De' lista a classe e suas subdivisões; 'De' e 'Até', o intervalo
+estante_frame = ttk.LabelFrame(tab_pesquisa, text="Estante (Classificação - CDU / Cutter)", padding="10")
+estante_frame.pack(fill=tk.X)
+
+ttk.Label(estante_frame, text="CDU de:").pack(side=tk.LEFT, padx=5)
+cdu_inicio_entry = ttk.Entry(estante_frame, width=20)
+cdu_inicio_entry.pack(side=tk.LEFT, padx=5)
+ttk.Label(estante_frame, text="até:").pack(side=tk.LEFT, padx=5)
+cdu_fim_entry = ttk.Entry(estante_frame, width=20)
+cdu_fim_entry.pack(side=tk.LEFT, padx=5)
+
+estante_button = ttk.Button(estante_frame, text="Listar em Ordem de Estante", command=listar_estante)
+estante_button.pack(side=tk.LEFT, padx=10)
+
 # Frame para os botões de ação (Editar/Excluir)
 acoes_frame = ttk.Frame(tab_pesquisa, padding=(0, 10))
 acoes_frame.pack(fill=tk.X)
@@ -870,6 +1365,15 @@ btn_excluir.pack(side=tk.LEFT, padx=5)
 btn_geral = ttk.Button(acoes_frame, text="Ver Planilha Geral", command=abrir_planilha_geral)
 btn_geral.pack(side=tk.RIGHT, padx=5)
 
+btn_backups = ttk.Button(acoes_frame, text="Cópias de Segurança", command=abrir_backups)
+btn_backups.pack(side=tk.RIGHT, padx=5)
+
+btn_inventario = ttk.Button(acoes_frame, text="Inventário", command=abrir_inventario)
+btn_inventario.pack(side=tk.RIGHT, padx=5)
+
+status_pesquisa_label = ttk.Label(acoes_frame, text="", foreground='gray')
+status_pesquisa_label.pack(side=tk.LEFT, padx=10)
+
 result_frame = ttk.Frame(tab_pesquisa)
 result_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
@@ -896,5 +1400,21 @@ result_tree.pack(fill=tk.BOTH, expand=True)
 inicializar_dados() # Carrega os dados na memória ao iniciar
 normalizar_planilhas_existentes() # Atualiza planilhas existentes com novas colunas/ordem
 
+# Observa as planilhas para recarregar edições feitas fora do sistema (ex.: no Excel)
+arquivos_monitorados = monitor_arquivos.arquivos_tipologias()
+monitor = monitor_arquivos.MonitorArquivos(lambda: list(arquivos_monitorados), _ao_alterar_planilha)
+ao_gravar.append(monitor.registrar_gravacao_propria)
+ao_gravar.append(_atualizar_arquivos_monitorados)
+ao_alterar_registro.append(indice_estante.atualizar)
+ao_alterar_registro.append(indice_sugestoes.atualizar)
+threading.Thread(target=_construir_sugestoes, name='Sugestoes', daemon=True).start()
+monitor.iniciar()
+_processar_recargas()
+
+# Cópias de segurança incrementais periódicas e ao fechar o sistema
+agendador_backup = backup.AgendadorBackup()
+agendador_backup.iniciar()
+app.protocol("WM_DELETE_WINDOW", fechar_aplicacao)
+
 # Inicia o loop da aplicação
 app.mainloop()
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Bloqueio por planilha para uso simultâneo em várias estações numa pasta compartilhada.
+
+Cada planilha 'biblioteca_<tipologia>.xlsx' tem seu próprio arquivo de trava
+('<planilha>.lock'), criado de forma atômica (O_CREAT | O_EXCL), de modo que
+gravações em tipologias diferentes nunca esperam umas pelas outras. A trava
+guarda uma senha única de quem a criou, e só quem tem a senha a renova ou a
+remove. Enquanto a gravação dura, a data de modificação da trava é renovada a
+cada TRAVA_RENOVACAO segundos; uma trava só é considerada abandonada quando quem
+espera a vê sem nenhuma mudança (data de modificação e conteúdo) por mais de
+TRAVA_ABANDONADA segundos do seu próprio relógio monotônico (estação que
+travou/caiu). A data da trava nunca é comparada com o relógio local, que pode
+estar adiantado em relação ao servidor da pasta compartilhada.
+O tempo de espera, a retenção e as contenções são registrados no módulo diagnostico.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import diagnostico
+
+# Tempo máximo de espera pela trava antes de desistir (segundos)
+ESPERA_MAXIMA = 10.0
+# Trava vista sem renovação por mais que isto é considerada abandonada (estação que travou/caiu)
+TRAVA_ABANDONADA = 120.0
+# Intervalo com que quem detém a trava renova sua data de modificação
+TRAVA_RENOVACAO = 15.0
+
+
+# Trava -> (assinatura observada, instante monotônico em que foi vista pela primeira vez)
+_observadas = {}
+_observadas_lock = threading.Lock()
+
+
+class BloqueioError(Exception):
+    """Não foi possível obter a trava da planilha dentro do tempo limite."""
+
+
+def caminho_trava(filename):
+    return f"{filename}.lock"
+
+
+def _ler_trava(trava):
+    try:
+        with open(trava, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _dono_trava(trava):
+    dados = _ler_trava(trava)
+    if not dados:
+        return "outra estação"
+    return f"{dados.get('estacao', '?')} (pid {dados.get('pid', '?')})"
+
+
+def _assinatura_trava(caminho):
+    """(mtime_ns, tamanho, conteúdo) da trava; muda a cada renovação ou troca de dono."""
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    st = os.stat(caminho)
+    return (st.st_mtime_ns, st.st_size, conteudo)
+
+
+def _remover_se_abandonada(trava):
+    try:
+        assinatura = _assinatura_trava(trava)
+    except OSError:
+        return
+    agora = time.monotonic()
+    with _observadas_lock:
+        vista, desde = _observadas.get(trava, (None, None))
+        if vista != assinatura:
+            _observadas[trava] = (assinatura, agora)
+            return
+    parada = agora - desde
+    if parada <= TRAVA_ABANDONADA:
+        return
+    # Move a trava para um nome exclusivo antes de conferir de novo: entre a leitura e a
+    # remoção, o dono pode tê-la renovado ou outra estação pode ter criado uma nova
+    afastada = f"{trava}.{uuid.uuid4().hex}.abandonada"
+    try:
+        os.rename(trava, afastada)
+    except OSError:
+        return  # Outra estação já a removeu
+    with _observadas_lock:
+        _observadas.pop(trava, None)
+    try:
+        inalterada = _assinatura_trava(afastada) == assinatura
+    except OSError:
+        return
+    if inalterada:
+        print(f"AVISO: Removendo trava abandonada '{trava}' ({_dono_trava(afastada)}, sem renovação há {parada:.0f}s).")
+        try:
+            os.remove(afastada)
+        except OSError:
+            pass
+        return
+    # A trava estava viva: devolve-a ao lugar (link falha se já houver outra trava lá)
+    try:
+        os.link(afastada, trava)
+    except OSError:
+        print(f"AVISO: Não foi possível devolver a trava '{trava}' de {_dono_trava(afastada)}.")
+    try:
+        os.remove(afastada)
+    except OSError:
+        pass
+
+
+def _adquirir(filename, espera_maxima):
+    """Cria a trava da planilha. Retorna (caminho da trava, senha)."""
+    trava = caminho_trava(filename)
+    nome = os.path.basename(filename)
+    senha = uuid.uuid4().hex
+    inicio = time.perf_counter()
+    pausa = 0.02
+    houve_contencao = False
+    while True:
+        try:
+            fd = os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not houve_contencao:
+                houve_contencao = True
+                diagnostico.contar(f'bloqueio.contencoes.{nome}')
+            _remover_se_abandonada(trava)
+            if time.perf_counter() - inicio > espera_maxima:
+                diagnostico.contar('bloqueio.timeouts')
+                raise BloqueioError(f"A planilha '{filename}' está sendo gravada por {_dono_trava(trava)}. Tente novamente em instantes.")
+            time.sleep(pausa)
+            pausa = min(pausa * 2, 0.5)
+            continue
+        with _observadas_lock:
+            _observadas.pop(trava, None)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'estacao': socket.gethostname(), 'pid': os.getpid(), 'inicio': time.time(), 'senha': senha}, f)
+        espera = time.perf_counter() - inicio
+        diagnostico.registrar('bloqueio.espera', espera, filename)
+        diagnostico.registrar(f'bloqueio.espera.{nome}', espera)
+        return trava, senha
+
+
+def _eh_dono(trava, senha):
+    return _ler_trava(trava).get('senha') == senha
+
+
+def _renovar(travas, parar):
+    """Renova a data de modificação das travas até 'parar' ser sinalizado."""
+    while not parar.wait(TRAVA_RENOVACAO):
+        for trava, senha in travas:
+            if _eh_dono(trava, senha):
+                try:
+                    os.utime(trava)
+                except OSError:
+                    pass
+            else:
+                print(f"AVISO: A trava '{trava}' foi removida por outra estação durante a gravação.")
+
+
+def _liberar(trava, senha):
+    # Só remove a própria trava: se ela foi tomada como abandonada, a que está lá é de outra estação
+    if _eh_dono(trava, senha):
+        try:
+            os.remove(trava)
+        except OSError:
+            pass
+
+
+@contextmanager
+def bloquear(*filenames, espera_maxima=ESPERA_MAXIMA):
+    """Trava uma ou mais planilhas durante o bloco, renovando as travas enquanto ele dura.
+    Várias planilhas são travadas sempre em ordem alfabética, evitando impasse entre estações.
+    """
+    travas = []
+    adquirido = None
+    parar = threading.Event()
+    renovacao = None
+    try:
+        for filename in sorted(set(os.path.abspath(f) for f in filenames)):
+            travas.append(_adquirir(filename, espera_maxima))
+        adquirido = time.perf_counter()
+        renovacao = threading.Thread(target=_renovar, args=(travas, parar), daemon=True)
+        renovacao.start()
+        yield
+    finally:
+        parar.set()
+        if renovacao is not None:
+            renovacao.join()
+        for trava, senha in reversed(travas):
+            _liberar(trava, senha)
+        if adquirido is not None:
+            retencao = time.perf_counter() - adquirido
+            for trava, _ in travas:
+                diagnostico.registrar(f'bloqueio.retencao.{os.path.basename(trava)[:-len(".lock")]}', retencao)
+
+
+def versao_arquivo(filename):
+    """Versão otimista da planilha: (mtime_ns, tamanho), ou None se não existir."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
@@ -0,0 +1,750 @@
+"""Núcleo de dados do catálogo, sem dependência de Tk.
+
+Concentra a leitura, a gravação e a filtragem das planilhas por tipologia para
+que possam ser usadas tanto pela interface (biblioteca.py) quanto por
+ferramentas de linha de comando, como o benchmark em tools/.
+"""
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import bloqueio
+import diagnostico
+
+# --- DEFINIÇÕES DE LAYOUT ---
+campos_registro = [
+    'Data', 'Registro', 'Autor', 'Título', 'Local', 'Editora',
+    'Edição', 'Volume', 'Número', 'Ano', 'Exemplar', 'Quantidade', 'Origem',
+    'Cutter', 'Classificação - CDU', 'Assuntos', 'Localização'
+]
+tipologias = ['Livro', 'Folhetos', 'Multimeios', 'Periódicos', 'Plaquetes', 'Obras Raras', 'Folhetos de Cordel', 'Obra de Referência', 'Outros']
+all_columns = campos_registro + ['Tipologia', 'Observação']
+
+# Campos exibidos como inteiros na tabela de pesquisa (Exemplar não é formatado como número)
+CAMPOS_INTEIROS_EXIBICAO = ['Número', 'Volume', 'Ano', 'Quantidade']
+# Campos normalizados como inteiros ao salvar (Exemplar tratado como texto livre)
+CAMPOS_INTEIROS_SALVAR = ['Volume', 'Ano', 'Quantidade']
+# Quantas vezes uma gravação é refeita se a planilha mudar entre a leitura e a escrita
+TENTATIVAS_CONCORRENCIA = 3
+# Critérios de particionamento: faixas de 'Registro' ou ano do campo 'Data'
+CRITERIOS_PARTICAO = ('registro', 'ano')
+# Segmentos fechados mantidos em memória (são imutáveis para novos registros)
+LIMITE_CACHE_SEGMENTOS = 64
+
+# Funções chamadas com o caminho do arquivo após cada gravação feita pelo sistema
+# (usado, por exemplo, pelo monitor de arquivos para ignorar as próprias gravações)
+ao_gravar = []
+# Funções chamadas com (tipologia, registro, linha) após cada inclusão, edição ou exclusão
+# feita pelo sistema; 'linha' é o dicionário gravado, ou None na exclusão (usado pelos índices)
+ao_alterar_registro = []
+
+
+class CatalogoError(Exception):
+    """Erro de regra de negócio do catálogo; a mensagem já é adequada ao usuário."""
+
+
+class RegistroDuplicadoError(CatalogoError):
+    """O Registro já existe na planilha de destino."""
+
+
+class RegistroNaoEncontradoError(CatalogoError):
+    """O Registro (ou o arquivo de origem) não foi encontrado."""
+
+
+class PlanilhaEmUsoError(CatalogoError):
+    """Outra estação está gravando a planilha e a trava não foi liberada a tempo."""
+
+
+class AlteracaoConcorrenteError(CatalogoError):
+    """A planilha mudou durante todas as tentativas de gravação."""
+
+
+class ConflitoEdicaoError(CatalogoError):
+    """Outra estação alterou os mesmos campos do registro que estão sendo editados."""
+
+    def __init__(self, mensagem, campos):
+        super().__init__(mensagem)
+        self.campos = campos
+
+
+def get_filename_for_tipologia(tipologia, pasta=''):
+    """Gera um nome de arquivo padronizado para uma dada tipologia."""
+    # Remove acentos, troca espaços por underscore e converte para minúsculas
+    normalized = unicodedata.normalize('NFKD', tipologia)
+    ascii_only = normalized.encode('ASCII', 'ignore').decode('ASCII')
+    safe_name = ascii_only.lower().replace(' ', '_')
+    return os.path.join(pasta, f'biblioteca_{safe_name}.xlsx')
+
+
+def _normalize_numero_value(val):
+    """Normaliza o valor do campo 'Número' SEM usar float.
+    - se for composto apenas por dígitos, retorna int
+    - caso contrário, retorna a string original (sem conversão numérica)
+    Isso evita que o campo vire 10.0, 10.5 etc. e facilita edição/salvamento.
+    """
+    s = str(val).strip()
+    if s == "":
+        return ""
+    if s.isdigit():
+        try:
+            return int(s)
+        except Exception:
+            return s
+    # Qualquer outra coisa permanece como texto
+    return s
+
+
+def _format_numero_for_display(val):
+    """Formata o campo 'Número' para exibição na tabela.
+    Sempre mostra apenas dígitos (sem casas decimais) ou vazio quando não houver valor.
+    """
+    # Tratar ausentes e NaN
+    if val is None:
+        return ""
+    if isinstance(val, float) and (math.isnan(val)):
+        return ""
+    s = str(val).strip()
+    if s == "" or s.lower() == "nan":
+        return ""
+    # Se conseguir virar inteiro, mostra como inteiro
+    if s.isdigit():
+        return str(int(s))
+    try:
+        i = int(float(s.replace(',', '.')))
+        return str(i)
+    except Exception:
+        # Em falha de parsing, não exibe nada para evitar lixo na tela
+        return ""
+
+
+def _normalize_int_field(val):
+    """Normaliza campos que devem ser inteiros (Volume, Ano, Exemplar, Quantidade).
+    - vazio -> ""
+    - somente dígitos -> int
+    - qualquer outra coisa -> texto original (sem lançar erro)
+    """
+    s = str(val).strip()
+    if s == "":
+        return ""
+    if s.isdigit():
+        try:
+            return int(s)
+        except Exception:
+            return s
+    # Se não forem só dígitos, mantém como texto
+    return s
+
+
+def validar_data(data_str):
+    if not data_str:
+        return True
+    s = str(data_str).strip()
+    # Exige exatamente DD/MM/AAAA com dois dígitos para dia e mês
+    if not re.match(r'^(0[1-9]|[12][0-9]|3[01])\/(0[1-9]|1[0-2])\/[0-9]{4}$', s):
+        return False
+    try:
+        # Validação de calendário (ex.: rejeita 31/02/2024)
+        datetime.strptime(s, '%d/%m/%Y')
+        return True
+    except ValueError:
+        return False
+
+
+def normalizar_dados_registro(dados):
+    """Normaliza in-place os campos numéricos de um registro antes de salvar."""
+    # Normaliza campo 'Número' antes de salvar (inteiro quando possível, senão texto)
+    if 'Número' in dados:
+        dados['Número'] = _normalize_numero_value(dados.get('Número', ''))
+    for campo_int in CAMPOS_INTEIROS_SALVAR:
+        if campo_int in dados:
+            dados[campo_int] = _normalize_int_field(dados.get(campo_int, ''))
+    return dados
+
+
+def _normalizar_colunas(df):
+    """Remove espaços dos nomes de colunas e garante todas as colunas de 'all_columns'.
+    Retorna (df, changed) indicando se a estrutura precisou ser ajustada.
+    """
+    df.columns = [str(c).strip() for c in df.columns]
+    changed = False
+    for col in all_columns:
+        if col not in df.columns:
+            df[col] = ""
+            changed = True
+    # Reordena colunas se necessário
+    if list(df.columns) != all_columns:
+        df = df[all_columns]
+        changed = True
+    return df, changed
+
+
+def ler_planilha(filename):
+    """Lê uma planilha de tipologia com 'Registro' como texto e colunas padronizadas."""
+    with diagnostico.medir('excel.read_excel', filename):
+        df_local = pd.read_excel(filename, dtype={'Registro': str})
+    diagnostico.contar('excel.linhas_lidas', len(df_local))
+    with diagnostico.medir('dataframe.normalizar_colunas', filename):
+        df_local, _ = _normalizar_colunas(df_local)
+    return df_local
+
+
+def gravar_planilha(df, filename):
+    """Grava o DataFrame na ordem padronizada, preservando zeros à esquerda em 'Registro'."""
+    df = df[all_columns]
+    if 'Registro' in df.columns:
+        df = df.assign(Registro=df['Registro'].astype(str))
+    with diagnostico.medir('excel.to_excel', filename):
+        df.to_excel(filename, index=False)
+    diagnostico.contar('excel.linhas_gravadas', len(df))
+    for callback in ao_gravar:
+        callback(filename)
+
+
+# --- ARMAZENAMENTO PARTICIONADO ---
+# Uma tipologia particionada não usa 'biblioteca_<tipologia>.xlsx': seus registros ficam em
+# segmentos 'biblioteca_<tipologia>.segNNNN.xlsx' descritos em 'biblioteca_<tipologia>.manifest.json'.
+# Novos registros vão sempre para o último segmento (aberto); os demais ficam fechados e
+# só são regravados em edições ou exclusões.
+_cache_segmentos = OrderedDict()  # caminho -> (versao, DataFrame)
+_cache_lock = threading.Lock()
+
+
+def caminho_manifesto(tipologia, pasta=''):
+    return get_filename_for_tipologia(tipologia, pasta)[:-len('.xlsx')] + '.manifest.json'
+
+
+def _caminho_segmento(tipologia, numero, pasta=''):
+    return get_filename_for_tipologia(tipologia, pasta)[:-len('.xlsx')] + f'.seg{numero:04d}.xlsx'
+
+
+def ler_manifesto(tipologia, pasta=''):
+    """Manifesto da tipologia particionada, ou None se ela usa um único arquivo."""
+    caminho = caminho_manifesto(tipologia, pasta)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _gravar_manifesto(tipologia, manifesto, pasta=''):
+    caminho = caminho_manifesto(tipologia, pasta)
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+    for callback in ao_gravar:
+        callback(caminho)
+
+
+def _caminhos_segmentos(tipologia, manifesto, pasta=''):
+    pasta_manifesto = os.path.dirname(caminho_manifesto(tipologia, pasta))
+    return [os.path.join(pasta_manifesto, seg['arquivo']) for seg in manifesto['segmentos']]
+
+
+def arquivos_da_tipologia(tipologia, pasta=''):
+    """Arquivos de dados existentes da tipologia, na ordem (segmentos ou a planilha única)."""
+    manifesto = ler_manifesto(tipologia, pasta)
+    if manifesto is None:
+        filename = get_filename_for_tipologia(tipologia, pasta)
+        return [filename] if os.path.exists(filename) else []
+    return [c for c in _caminhos_segmentos(tipologia, manifesto, pasta) if os.path.exists(c)]
+
+
+def _ano_da_data(val):
+    """Ano (AAAA) ao final do campo 'Data', ou None."""
+    m = re.search(r'(\d{4})\s*$', '' if val is None else str(val))
+    return int(m.group(1)) if m else None
+
+
+def _estatisticas_segmento(df):
+    registros = [str(v) for v in df['Registro'].dropna()]
+    numeros = [int(v) for v in registros if v.isdigit()]
+    anos = [a for a in (_ano_da_data(v) for v in df['Data'].dropna()) if a is not None]
+    return {
+        'linhas': len(df),
+        'registro_min': min(numeros, default=None),
+        'registro_max': max(numeros, default=None),
+        'largura': max((len(v) for v in registros if v.isdigit()), default=0),
+        'ano_min': min(anos, default=None),
+        'ano_max': max(anos, default=None),
+    }
+
+
+def _ler_segmento(caminho, fechado):
+    """Lê um segmento; segmentos fechados vêm do cache enquanto o arquivo não mudar."""
+    if not fechado:
+        return ler_planilha(caminho)
+    versao = bloqueio.versao_arquivo(caminho)
+    with _cache_lock:
+        em_cache = _cache_segmentos.get(caminho)
+        if em_cache is not None and em_cache[0] == versao:
+            _cache_segmentos.move_to_end(caminho)
+            diagnostico.contar('particao.cache_acertos')
+            return em_cache[1].copy()
+    df = ler_planilha(caminho)
+    with _cache_lock:
+        _cache_segmentos[caminho] = (versao, df.copy())
+        _cache_segmentos.move_to_end(caminho)
+        while len(_cache_segmentos) > LIMITE_CACHE_SEGMENTOS:
+            _cache_segmentos.popitem(last=False)
+    return df
+
+
+def _atualizar_manifesto(tipologia, gravados, pasta='', manifesto=None):
+    """Atualiza as estatísticas dos segmentos regravados ({caminho: df}) e grava o manifesto."""
+    if manifesto is None:
+        manifesto = ler_manifesto(tipologia, pasta)
+    if manifesto is None:
+        return
+    for seg, caminho in zip(manifesto['segmentos'], _caminhos_segmentos(tipologia, manifesto, pasta)):
+        if caminho in gravados:
+            seg.update(_estatisticas_segmento(gravados[caminho]))
+    _gravar_manifesto(tipologia, manifesto, pasta)
+
+
+def _arquivo_do_registro(tipologia, registro, pasta=''):
+    """Arquivo onde o 'Registro' está gravado (a planilha única, ou o segmento que o contém).
+    A planilha única é retornada sem conferir se o registro está nela (quem a lê confere);
+    numa tipologia particionada, retorna None se nenhum segmento tiver o registro.
+    """
+    manifesto = ler_manifesto(tipologia, pasta)
+    if manifesto is None:
+        return get_filename_for_tipologia(tipologia, pasta)
+    registro = str(registro)
+    numero = int(registro) if registro.isdigit() else None
+    candidatos = []
+    for seg, caminho in zip(manifesto['segmentos'], _caminhos_segmentos(tipologia, manifesto, pasta)):
+        dentro = (numero is not None and seg.get('registro_min') is not None
+                  and seg['registro_min'] <= numero <= seg['registro_max'])
+        # Segmentos cuja faixa contém o número são verificados primeiro
+        candidatos.insert(0 if dentro else len(candidatos), (seg, caminho))
+    for seg, caminho in candidatos:
+        if not os.path.exists(caminho):
+            continue
+        df = _ler_segmento(caminho, seg.get('fechado', False))
+        if registro in df['Registro'].astype(str).values:
+            return caminho
+    return None
+
+
+def _preparar_anexo(tipologia, dados, pasta=''):
+    """Decide em qual arquivo um novo registro da tipologia deve ser gravado.
+    Retorna (caminho, maior_registro_anterior, largura_anterior, manifesto). Em tipologias
+    particionadas, fecha o segmento aberto e cria outro quando ele atinge o limite (critério
+    'registro') ou quando o registro é de um ano posterior (critério 'ano'); o manifesto
+    alterado só é gravado depois que o registro for salvo.
+    """
+    manifesto = ler_manifesto(tipologia, pasta)
+    if manifesto is None:
+        return get_filename_for_tipologia(tipologia, pasta), 0, 0, None
+    segmentos = manifesto['segmentos']
+    cauda = segmentos[-1]
+    maximo = max((s['registro_max'] or 0 for s in segmentos[:-1]), default=0)
+    largura = max((s.get('largura', 0) for s in segmentos[:-1]), default=0)
+    if manifesto['criterio'] == 'registro':
+        abrir_novo = cauda['linhas'] >= manifesto['tamanho_segmento']
+    else:
+        ano = _ano_da_data(dados.get('Data'))
+        abrir_novo = ano is not None and cauda.get('ano_max') is not None and ano > cauda['ano_max']
+    if abrir_novo:
+        cauda['fechado'] = True
+        maximo = max(maximo, cauda['registro_max'] or 0)
+        largura = max(largura, cauda.get('largura', 0))
+        novo = _caminho_segmento(tipologia, len(segmentos) + 1, pasta)
+        segmentos.append(dict(_estatisticas_segmento(pd.DataFrame(columns=all_columns)),
+                              arquivo=os.path.basename(novo), fechado=False))
+        diagnostico.contar('particao.segmentos_criados')
+    caminho = _caminhos_segmentos(tipologia, manifesto, pasta)[-1]
+    return caminho, maximo, largura, manifesto
+
+
+def _dividir_em_segmentos(df, criterio, tamanho_segmento):
+    if criterio == 'registro':
+        chave = df['Registro'].astype(str).map(lambda v: int(v) if v.isdigit() else float('inf'))
+        df = df.iloc[chave.argsort(kind='stable')]
+        return [df.iloc[i:i + tamanho_segmento] for i in range(0, len(df), tamanho_segmento)] or [df]
+    anos = df['Data'].map(_ano_da_data)
+    # Registros sem ano ficam no segmento aberto (o do ano mais recente)
+    anos = anos.fillna(anos.max() if anos.notna().any() else 0)
+    return [grupo for _, grupo in df.groupby(anos, sort=True)] or [df]
+
+
+def _gravar_segmentos(tipologia, df, criterio, tamanho_segmento, pasta=''):
+    """Grava 'df' como segmentos da tipologia (o último aberto) e o manifesto correspondente.
+    Segmentos de uma divisão anterior que sobrarem são removidos.
+    """
+    anteriores = set(arquivos_da_tipologia(tipologia, pasta)) if ler_manifesto(tipologia, pasta) else set()
+    manifesto = {'versao': 1, 'criterio': criterio, 'tamanho_segmento': tamanho_segmento, 'segmentos': []}
+    for numero, parte in enumerate(_dividir_em_segmentos(df, criterio, tamanho_segmento), start=1):
+        caminho = _caminho_segmento(tipologia, numero, pasta)
+        gravar_planilha(parte, caminho)
+        anteriores.discard(caminho)
+        manifesto['segmentos'].append(dict(_estatisticas_segmento(parte), arquivo=os.path.basename(caminho), fechado=True))
+    manifesto['segmentos'][-1]['fechado'] = False
+    _gravar_manifesto(tipologia, manifesto, pasta)
+    for caminho in anteriores:
+        os.remove(caminho)
+    return manifesto
+
+
+def particionar_tipologia(tipologia, criterio='registro', tamanho_segmento=5000, pasta=''):
+    """Converte a planilha única da tipologia em segmentos com manifesto.
+    A planilha original é preservada como '<planilha>.antes_particao'.
+    """
+    if criterio not in CRITERIOS_PARTICAO:
+        raise ValueError(f"Critério de particionamento inválido: {criterio}")
+    filename = get_filename_for_tipologia(tipologia, pasta)
+    with _travar(filename):
+        if ler_manifesto(tipologia, pasta) is not None:
+            raise CatalogoError(f"A tipologia '{tipologia}' já está particionada.")
+        if not os.path.exists(filename):
+            raise RegistroNaoEncontradoError(f"Nenhum dado foi salvo para '{tipologia}' ainda. O arquivo '{filename}' não existe.")
+        manifesto = _gravar_segmentos(tipologia, ler_planilha(filename), criterio, tamanho_segmento, pasta)
+        os.replace(filename, f'{filename}.antes_particao')
+    return manifesto
+
+
+def gravar_tipologia(tipologia, df, pasta=''):
+    """Substitui todo o conteúdo da tipologia por 'df' (ex.: ao restaurar uma cópia de segurança).
+    Tipologias particionadas são regravadas em segmentos com o mesmo critério.
+    """
+    filename = get_filename_for_tipologia(tipologia, pasta)
+    df = df.copy()
+    df['Tipologia'] = tipologia
+    with _travar(filename):
+        manifesto = ler_manifesto(tipologia, pasta)
+        if manifesto is None:
+            gravar_planilha(df, filename)
+        else:
+            _gravar_segmentos(tipologia, df, manifesto['criterio'], manifesto['tamanho_segmento'], pasta)
+
+
+def carregar_tipologia(tipologia, pasta=''):
+    """Carrega a planilha (ou os segmentos) de uma tipologia; DataFrame vazio se não houver dados."""
+    manifesto = ler_manifesto(tipologia, pasta)
+    if manifesto is None:
+        filename = get_filename_for_tipologia(tipologia, pasta)
+        if not os.path.exists(filename):
+            return pd.DataFrame(columns=all_columns)
+        return ler_planilha(filename)
+    partes = []
+    for seg, caminho in zip(manifesto['segmentos'], _caminhos_segmentos(tipologia, manifesto, pasta)):
+        if os.path.exists(caminho):
+            partes.append(_ler_segmento(caminho, seg.get('fechado', False)))
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=all_columns)
+    return pd.concat(partes, ignore_index=True)[all_columns]
+
+
+def carregar_catalogo(pasta=''):
+    """Carrega todos os dados de todas as planilhas e os combina em um único DataFrame."""
+    todos_os_dfs = []
+    for tipologia in tipologias:
+        if not arquivos_da_tipologia(tipologia, pasta):
+            continue
+        try:
+            todos_os_dfs.append(carregar_tipologia(tipologia, pasta))
+        except Exception as e:
+            print(f"Erro ao ler {get_filename_for_tipologia(tipologia, pasta)}: {e}")
+
+    if todos_os_dfs:
+        with diagnostico.medir('dataframe.concat'):
+            return pd.concat(todos_os_dfs, ignore_index=True)[all_columns]
+    return pd.DataFrame(columns=all_columns)
+
+
+def substituir_tipologia(df, tipologia, df_tipologia):
+    """Retorna 'df' com as linhas da tipologia trocadas por 'df_tipologia' (recarga de um único arquivo)."""
+    restantes = df[df['Tipologia'] != tipologia] if df is not None and not df.empty else None
+    partes = [p for p in (restantes, df_tipologia) if p is not None and not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=all_columns)
+    return pd.concat(partes, ignore_index=True)[all_columns]
+
+
+def normalizar_planilha(filename, trava=None):
+    """Ajusta a planilha existente para conter 'all_columns' na ordem correta.
+    'trava' é a planilha principal da tipologia quando 'filename' é um segmento.
+    Retorna True se o arquivo precisou ser regravado.
+    """
+    with _travar(trava or filename):
+        for _ in range(TENTATIVAS_CONCORRENCIA):
+            versao = bloqueio.versao_arquivo(filename)
+            if versao is None:
+                return False
+            with diagnostico.medir('excel.read_excel', filename):
+                df_local = pd.read_excel(filename, dtype={'Registro': str})
+            df_local, changed = _normalizar_colunas(df_local)
+            if not changed:
+                return False
+            if _gravar_se_inalterado([(df_local, filename, versao)]):
+                return True
+    raise _erro_concorrencia(filename)
+
+
+def proximo_registro(df_local, maximo_anterior=0, largura_anterior=0):
+    """Calcula o próximo 'Registro' sequencial da tipologia.
+    'maximo_anterior'/'largura_anterior' cobrem os registros que não estão em 'df_local'
+    (segmentos fechados). Retorna (registro_formatado, largura) com largura mínima 5.
+    """
+    def _parse_registro_numeric(s):
+        try:
+            return int(str(s)) if str(s).isdigit() else None
+        except Exception:
+            return None
+    valores = df_local['Registro'].tolist() if 'Registro' in df_local.columns else []
+    existentes_nums = [n for n in (_parse_registro_numeric(v) for v in valores) if n is not None]
+    atual_max = max(existentes_nums + [maximo_anterior])
+    proximo_num = atual_max + 1
+    # Largura mínima 5; aumenta conforme necessário
+    largura_existente = max([len(str(x)) for x in existentes_nums], default=0)
+    largura = max(5, largura_existente, largura_anterior, len(str(proximo_num)))
+    return str(proximo_num).zfill(largura), largura
+
+
+@contextmanager
+def _travar(*filenames):
+    """Trava as planilhas indicadas (uma trava por arquivo) durante o bloco."""
+    try:
+        with bloqueio.bloquear(*filenames):
+            yield
+    except bloqueio.BloqueioError as e:
+        raise PlanilhaEmUsoError(str(e)) from e
+
+
+def _ler_versionado(filename):
+    """Lê a planilha junto com a sua versão (None se o arquivo ainda não existir)."""
+    versao = bloqueio.versao_arquivo(filename)
+    if versao is None:
+        return pd.DataFrame(columns=all_columns), None
+    return ler_planilha(filename), versao
+
+
+def _gravar_se_inalterado(gravacoes):
+    """Grava cada (df, filename, versao_lida) somente se nenhuma planilha mudou desde a leitura.
+    Protege contra quem altera o arquivo sem usar a trava (ex.: o Excel). Retorna False para refazer.
+    """
+    for _, filename, versao in gravacoes:
+        if bloqueio.versao_arquivo(filename) != versao:
+            diagnostico.contar('concorrencia.repeticoes')
+            return False
+    for df, filename, _ in gravacoes:
+        gravar_planilha(df, filename)
+    return True
+
+
+def _erro_concorrencia(filename):
+    return AlteracaoConcorrenteError(f"A planilha {filename} foi alterada por outro programa durante a gravação. Tente novamente.")
+
+
+def _texto_exibicao(coluna, val):
+    """Valor como aparece na tabela de pesquisa (mesma regra de preparar_exibicao)."""
+    if coluna in CAMPOS_INTEIROS_EXIBICAO:
+        return _format_numero_for_display(val)
+    if val is None or (isinstance(val, float) and math.isnan(val)):
+        return ""
+    return str(val)
+
+
+def _mesclar_edicao(atuais, originais, novos_dados):
+    """Mescla de três vias de uma edição.
+    'originais' são os valores exibidos quando a edição começou e 'atuais' os valores
+    gravados agora. Campos alterados só pela outra estação são preservados; campos
+    alterados dos dois lados com valores diferentes são conflitos.
+    Retorna (valores_a_aplicar, campos_em_conflito).
+    """
+    aplicar = {}
+    conflitos = []
+    for col, novo in novos_dados.items():
+        if col == 'Registro':
+            continue
+        if originais is None or col not in originais:
+            aplicar[col] = novo
+            continue
+        original = str(originais[col])
+        atual = _texto_exibicao(col, atuais.get(col))
+        novo_txt = _texto_exibicao(col, novo)
+        if atual == original or novo_txt == atual:
+            aplicar[col] = novo
+        elif novo_txt == original:
+            # Só a outra estação alterou este campo: mantém o valor dela
+            diagnostico.contar('concorrencia.mesclas')
+        else:
+            conflitos.append(col)
+            aplicar[col] = novo
+    return aplicar, conflitos
+
+
+def _gravar_e_atualizar_manifestos(gravacoes, manifestos):
+    """Grava as planilhas se nenhuma mudou e, em seguida, atualiza os manifestos afetados.
+    'manifestos' é uma lista de (tipologia, pasta, manifesto ou None).
+    """
+    if not _gravar_se_inalterado(gravacoes):
+        return False
+    gravados = {filename: df for df, filename, _ in gravacoes}
+    for tipologia, pasta, manifesto in manifestos:
+        if manifesto is not None:
+            _atualizar_manifesto(tipologia, gravados, pasta, manifesto)
+    return True
+
+
+def adicionar_registro(tipologia, dados, pasta=''):
+    """Acrescenta um registro na planilha da tipologia e retorna o 'Registro' atribuído.
+    O 'Registro' é sempre o próximo da sequência da tipologia; se o usuário digitar
+    o número correto, apenas normaliza o zero-padding. Em tipologias particionadas o
+    registro vai para o segmento aberto.
+    """
+    dados = normalizar_dados_registro(dict(dados))
+    dados['Tipologia'] = tipologia
+    reg_usuario = str(dados.get('Registro', '')).strip()
+    filename = get_filename_for_tipologia(tipologia, pasta)
+
+    with _travar(filename):
+        for _ in range(TENTATIVAS_CONCORRENCIA):
+            destino, maximo_anterior, largura_anterior, manifesto = _preparar_anexo(tipologia, dados, pasta)
+            df_local, versao = _ler_versionado(destino)
+
+            registro_sequencial, largura = proximo_registro(df_local, maximo_anterior, largura_anterior)
+            if not reg_usuario.isdigit() or reg_usuario != registro_sequencial:
+                # Força o próximo sequencial
+                dados['Registro'] = registro_sequencial
+            else:
+                dados['Registro'] = str(int(reg_usuario)).zfill(largura)
+
+            if not df_local.empty and dados['Registro'] in df_local['Registro'].astype(str).tolist():
+                raise RegistroDuplicadoError(f"O Registro '{dados['Registro']}' já existe na planilha {destino}!")
+
+            novo_registro, _ = _normalizar_colunas(pd.DataFrame([dados]))
+            if not df_local.empty:
+                novo_registro = pd.concat([df_local, novo_registro], ignore_index=True)
+            if _gravar_e_atualizar_manifestos([(novo_registro, destino, versao)], [(tipologia, pasta, manifesto)]):
+                _notificar_alteracao(tipologia, dados['Registro'], dados)
+                return dados['Registro']
+    raise _erro_concorrencia(filename)
+
+
+def _notificar_alteracao(tipologia, registro, linha):
+    for callback in ao_alterar_registro:
+        callback(tipologia, str(registro), linha)
+
+
+def remover_registro(tipologia, registro, pasta=''):
+    """Remove o 'Registro' da planilha (ou do segmento) da tipologia."""
+    filename = get_filename_for_tipologia(tipologia, pasta)
+    if not arquivos_da_tipologia(tipologia, pasta):
+        raise RegistroNaoEncontradoError(f"Arquivo de origem '{filename}' não encontrado!")
+    with _travar(filename):
+        for _ in range(TENTATIVAS_CONCORRENCIA):
+            origem = _arquivo_do_registro(tipologia, registro, pasta)
+            if origem is None:
+                return
+            df_local, versao = _ler_versionado(origem)
+            df_local = df_local[df_local['Registro'].astype(str) != str(registro)]
+            if _gravar_e_atualizar_manifestos([(df_local, origem, versao)], [(tipologia, pasta, ler_manifesto(tipologia, pasta))]):
+                _notificar_alteracao(tipologia, registro, None)
+                return
+    raise _erro_concorrencia(filename)
+
+
+def atualizar_registro(tipologia_original, registro, novos_dados, pasta='', originais=None, forcar=False):
+    """Atualiza um registro existente, movendo-o de planilha se a tipologia mudou.
+    O 'Registro' nunca é alterado. Se 'originais' (valores exibidos quando a edição
+    começou) for informado, alterações feitas por outra estação nesse meio tempo são
+    mescladas; campos em conflito geram ConflitoEdicaoError, a menos que 'forcar' seja True.
+    """
+    novos_dados = normalizar_dados_registro(dict(novos_dados))
+    novos_dados['Registro'] = registro
+    nova_tipologia = novos_dados.get('Tipologia', tipologia_original)
+
+    filename_origem = get_filename_for_tipologia(tipologia_original, pasta)
+    filename_destino = get_filename_for_tipologia(nova_tipologia, pasta)
+    if not arquivos_da_tipologia(tipologia_original, pasta):
+        raise RegistroNaoEncontradoError(f"Arquivo de origem '{filename_origem}' não encontrado!")
+
+    with _travar(filename_origem, filename_destino):
+        for _ in range(TENTATIVAS_CONCORRENCIA):
+            arquivo_origem = _arquivo_do_registro(tipologia_original, registro, pasta) or filename_origem
+            df_origem, versao_origem = _ler_versionado(arquivo_origem)
+            # Localiza pelo Registro original
+            idx = df_origem[df_origem['Registro'].astype(str) == str(registro)].index
+            if idx.empty:
+                raise RegistroNaoEncontradoError(f"Registro '{registro}' não encontrado em '{filename_origem}'.")
+
+            atuais = df_origem.loc[idx].iloc[0].to_dict()
+            aplicar, conflitos = _mesclar_edicao(atuais, originais, novos_dados)
+            if conflitos and not forcar:
+                diagnostico.contar('concorrencia.conflitos')
+                raise ConflitoEdicaoError(
+                    f"O registro '{registro}' foi alterado em outra estação nos campos: {', '.join(conflitos)}.", conflitos)
+
+            manifesto_origem = ler_manifesto(tipologia_original, pasta)
+            # Se a tipologia não mudou, atualiza no mesmo arquivo
+            if nova_tipologia == tipologia_original:
+                for col, val in aplicar.items():
+                    # Colunas lidas como numéricas não aceitam texto/vazio sem conversão prévia
+                    df_origem[col] = df_origem[col].astype(object)
+                    df_origem.loc[idx, col] = val
+                if _gravar_e_atualizar_manifestos([(df_origem, arquivo_origem, versao_origem)],
+                                                  [(tipologia_original, pasta, manifesto_origem)]):
+                    _notificar_alteracao(tipologia_original, registro, df_origem.loc[idx].iloc[0].to_dict())
+                    return
+                continue
+
+            # Move o registro: verifica o destino antes de remover da origem
+            duplicado = RegistroDuplicadoError(f"O Registro '{registro}' já existe na planilha {filename_destino}! Não é possível mover mantendo a sequência.")
+            if ler_manifesto(nova_tipologia, pasta) is not None and _arquivo_do_registro(nova_tipologia, registro, pasta) is not None:
+                raise duplicado
+            atuais.update(aplicar)
+            arquivo_destino, _, _, manifesto_destino = _preparar_anexo(nova_tipologia, atuais, pasta)
+            df_destino, versao_destino = _ler_versionado(arquivo_destino)
+            # Planilha única: confere na própria planilha lida
+            if not df_destino.empty and str(registro) in df_destino['Registro'].astype(str).values:
+                raise duplicado
+
+            registro_df, _ = _normalizar_colunas(pd.DataFrame([atuais]))
+            if not df_destino.empty:
+                registro_df = pd.concat([df_destino, registro_df], ignore_index=True)
+            if _gravar_e_atualizar_manifestos([(df_origem.drop(idx), arquivo_origem, versao_origem),
+                                               (registro_df, arquivo_destino, versao_destino)],
+                                              [(tipologia_original, pasta, manifesto_origem),
+                                               (nova_tipologia, pasta, manifesto_destino)]):
+                _notificar_alteracao(tipologia_original, registro, None)
+                _notificar_alteracao(nova_tipologia, registro, atuais)
+                return
+    raise _erro_concorrencia(filename_origem)
+
+
+def filtrar_catalogo(df, termo_busca):
+    """Filtra por Registro, Autor ou Título (substring, sem diferenciar maiúsculas)."""
+    termo_busca = str(termo_busca).strip().lower()
+    if df is None or df.empty or not termo_busca:
+        return df
+    with diagnostico.medir('dataframe.filtrar'):
+        mask = None
+        for col in ['Registro', 'Autor', 'Título']:
+            match = df[col].fillna("").astype(str).str.lower().str.contains(termo_busca, na=False, regex=False)
+            mask = match if mask is None else (mask | match)
+        return df[mask]
+
+
+def preparar_exibicao(df):
+    """Converte o DataFrame em texto pronto para a tabela de pesquisa.
+    Evita exibir 'nan' e formata campos numéricos para inteiros quando aplicável.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=all_columns)
+    with diagnostico.medir('dataframe.preparar_exibicao'):
+        df_temp, _ = _normalizar_colunas(df.copy())
+        for campo_int in CAMPOS_INTEIROS_EXIBICAO:
+            df_temp[campo_int] = df_temp[campo_int].apply(_format_numero_for_display)
+        return df_temp.fillna("").astype(str)
+
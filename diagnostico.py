@@ -0,0 +1,202 @@
+"""Instrumentação leve de desempenho (spans, contadores, histogramas e cProfile).
+
+Os spans são agregados em memória e podem ser exportados em JSON/CSV ou vistos
+na janela oculta de diagnóstico da interface (Ctrl+Shift+D). Não depende de Tk.
+"""
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Limites superiores (em ms) das faixas do histograma; a última faixa é "acima de"
+LIMITES_HISTOGRAMA_MS = [1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+# Amostras recentes mantidas por span para o cálculo de percentis
+AMOSTRAS_POR_SPAN = 1000
+PASTA_PERFIS = 'diagnostico'
+
+_lock = threading.Lock()
+_spans = {}
+_contadores = {}
+_eventos = deque(maxlen=5000)
+_local = threading.local()
+_perfil_armado = False
+ultimo_perfil = None  # dict com 'acao', 'arquivo' e 'texto' da última captura
+
+
+def _novo_span():
+    return {
+        'contagem': 0,
+        'total_s': 0.0,
+        'min_s': None,
+        'max_s': 0.0,
+        'histograma': [0] * (len(LIMITES_HISTOGRAMA_MS) + 1),
+        'amostras': deque(maxlen=AMOSTRAS_POR_SPAN),
+    }
+
+
+def registrar(nome, duracao_s, detalhe=None):
+    """Registra uma duração já medida no span 'nome'."""
+    duracao_ms = duracao_s * 1000
+    faixa = len(LIMITES_HISTOGRAMA_MS)
+    for i, limite in enumerate(LIMITES_HISTOGRAMA_MS):
+        if duracao_ms <= limite:
+            faixa = i
+            break
+    with _lock:
+        span = _spans.get(nome)
+        if span is None:
+            span = _spans[nome] = _novo_span()
+        span['contagem'] += 1
+        span['total_s'] += duracao_s
+        span['min_s'] = duracao_s if span['min_s'] is None else min(span['min_s'], duracao_s)
+        span['max_s'] = max(span['max_s'], duracao_s)
+        span['histograma'][faixa] += 1
+        span['amostras'].append(duracao_s)
+        _eventos.append((time.time(), nome, duracao_s, detalhe))
+
+
+@contextmanager
+def medir(nome, detalhe=None):
+    """Mede o bloco e agrega a duração no span 'nome'."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(nome, time.perf_counter() - inicio, detalhe)
+
+
+def contar(nome, quantidade=1):
+    """Incrementa um contador simples (ex.: linhas lidas, itens inseridos)."""
+    with _lock:
+        _contadores[nome] = _contadores.get(nome, 0) + quantidade
+
+
+def armar_perfil():
+    """Ativa a captura com cProfile para a próxima ação de usuário (uma única vez)."""
+    global _perfil_armado
+    _perfil_armado = True
+
+
+def limpar_perfil_armado():
+    global _perfil_armado
+    _perfil_armado = False
+
+
+def perfil_armado():
+    return _perfil_armado
+
+
+@contextmanager
+def acao(nome):
+    """Span de uma ação completa de usuário; captura cProfile se estiver armado.
+    Pode ser usado como decorador. Ações aninhadas contam apenas como spans.
+    """
+    global _perfil_armado, ultimo_perfil
+    profundidade = getattr(_local, 'profundidade', 0)
+    perfil = None
+    if profundidade == 0 and _perfil_armado:
+        _perfil_armado = False
+        perfil = cProfile.Profile()
+    _local.profundidade = profundidade + 1
+    inicio = time.perf_counter()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        _local.profundidade = profundidade
+        registrar(f'acao.{nome}', time.perf_counter() - inicio)
+        if perfil is not None:
+            ultimo_perfil = _salvar_perfil(nome, perfil)
+
+
+def _salvar_perfil(nome, perfil):
+    os.makedirs(PASTA_PERFIS, exist_ok=True)
+    carimbo = datetime.now().strftime('%Y%m%d-%H%M%S')
+    arquivo = os.path.join(PASTA_PERFIS, f'perfil_{nome}_{carimbo}.prof')
+    perfil.dump_stats(arquivo)
+    saida = io.StringIO()
+    pstats.Stats(perfil, stream=saida).sort_stats('cumulative').print_stats(30)
+    return {'acao': nome, 'arquivo': arquivo, 'texto': saida.getvalue()}
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    k = (len(ordenados) - 1) * p / 100.0
+    inf = int(k)
+    sup = min(inf + 1, len(ordenados) - 1)
+    return ordenados[inf] + (ordenados[sup] - ordenados[inf]) * (k - inf)
+
+
+def resumo():
+    """Retorna (spans, contadores): lista de dicts por span ordenada pelo tempo total, e os contadores."""
+    with _lock:
+        copia = {nome: dict(span, amostras=sorted(span['amostras']), histograma=list(span['histograma']))
+                 for nome, span in _spans.items()}
+        contadores = dict(_contadores)
+    spans = []
+    for nome, span in copia.items():
+        spans.append({
+            'nome': nome,
+            'contagem': span['contagem'],
+            'total_s': span['total_s'],
+            'media_s': span['total_s'] / span['contagem'] if span['contagem'] else 0.0,
+            'min_s': span['min_s'],
+            'max_s': span['max_s'],
+            'p50_s': _percentil(span['amostras'], 50),
+            'p95_s': _percentil(span['amostras'], 95),
+            'histograma': span['histograma'],
+        })
+    spans.sort(key=lambda s: s['total_s'], reverse=True)
+    return spans, contadores
+
+
+def eventos_recentes():
+    with _lock:
+        return list(_eventos)
+
+
+def exportar_json(caminho):
+    spans, contadores = resumo()
+    dados = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'limites_histograma_ms': LIMITES_HISTOGRAMA_MS,
+        'spans': spans,
+        'contadores': contadores,
+        'eventos': [
+            {'instante': datetime.fromtimestamp(t).isoformat(timespec='milliseconds'), 'span': nome,
+             'duracao_s': duracao, 'detalhe': detalhe}
+            for t, nome, duracao, detalhe in eventos_recentes()
+        ],
+    }
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+
+
+def exportar_csv(caminho):
+    """Exporta o log de eventos (um span medido por linha)."""
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['instante', 'span', 'duracao_ms', 'detalhe'])
+        for t, nome, duracao, detalhe in eventos_recentes():
+            writer.writerow([datetime.fromtimestamp(t).isoformat(timespec='milliseconds'), nome,
+                             f'{duracao * 1000:.3f}', detalhe or ''])
+
+
+def limpar():
+    global ultimo_perfil
+    with _lock:
+        _spans.clear()
+        _contadores.clear()
+        _eventos.clear()
+    ultimo_perfil = None
@@ -0,0 +1,205 @@
+"""Exportação consolidada em fluxo (Excel, CSV ou Parquet) com memória constante.
+
+As linhas são lidas uma a uma das planilhas de cada tipologia (openpyxl em modo
+somente leitura) ou da visualização atual, e escritas diretamente no arquivo de
+saída, sem montar cópias do catálogo inteiro. A gravação é feita num arquivo
+temporário que só substitui o destino ao final, de modo que um cancelamento não
+deixa planilha pela metade.
+"""
+import csv
+import math
+import os
+
+from openpyxl import Workbook, load_workbook
+
+import diagnostico
+from catalogo import all_columns, tipologias, arquivos_da_tipologia
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional
+    pa = None
+    pq = None
+
+FORMATOS = {'xlsx': 'Excel (.xlsx)', 'csv': 'CSV (.csv)', 'parquet': 'Parquet (.parquet)'}
+# Linhas acumuladas antes de cada gravação em lote (Parquet) e entre avisos de progresso
+TAMANHO_LOTE = 5000
+
+
+class ExportacaoCancelada(Exception):
+    """A exportação foi cancelada pelo usuário."""
+
+
+def formatos_disponiveis():
+    """Formatos suportados no ambiente atual (Parquet depende do pyarrow)."""
+    return [f for f in FORMATOS if f != 'parquet' or pa is not None]
+
+
+def _valor_celula(val):
+    """Converte ausentes (None/NaN) em None e mantém os demais valores."""
+    if val is None:
+        return None
+    if isinstance(val, float) and math.isnan(val):
+        return None
+    return val
+
+
+def contar_linhas_planilha(filename):
+    """Estimativa barata do número de linhas de dados (usa a dimensão gravada na planilha)."""
+    wb = load_workbook(filename, read_only=True)
+    try:
+        ws = wb.active
+        return max((ws.max_row or 1) - 1, 0)
+    finally:
+        wb.close()
+
+
+def iterar_linhas_planilha(filename):
+    """Gera as linhas de uma planilha de tipologia na ordem de 'all_columns'."""
+    wb = load_workbook(filename, read_only=True)
+    try:
+        ws = wb.active
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        posicoes = {str(c).strip(): i for i, c in enumerate(cabecalho) if c is not None}
+        indices = [posicoes.get(col) for col in all_columns]
+        idx_registro = all_columns.index('Registro')
+        for linha in linhas:
+            if not any(v is not None for v in linha):
+                continue
+            valores = [_valor_celula(linha[i]) if i is not None and i < len(linha) else None for i in indices]
+            # Preserva 'Registro' como texto (zeros à esquerda)
+            if valores[idx_registro] is not None:
+                valores[idx_registro] = str(valores[idx_registro])
+            yield valores
+    finally:
+        wb.close()
+
+
+def fonte_planilhas(pasta='', selecao=None):
+    """Retorna (total_estimado, gerador de linhas) lendo diretamente as planilhas de cada tipologia
+    (todas, ou só as de 'selecao'). Tipologias particionadas são lidas segmento a segmento.
+    """
+    arquivos = [f for t in (selecao or tipologias) for f in arquivos_da_tipologia(t, pasta)]
+    total = sum(contar_linhas_planilha(f) for f in arquivos)
+
+    def gerar():
+        for filename in arquivos:
+            yield from iterar_linhas_planilha(filename)
+    return total, gerar()
+
+
+def fonte_dataframe(df):
+    """Retorna (total, gerador de linhas) a partir de um DataFrame (ex.: a visualização filtrada)."""
+    colunas = [col for col in all_columns if col in df.columns]
+    idx_registro = all_columns.index('Registro')
+
+    def gerar():
+        # itertuples percorre o DataFrame sem copiá-lo
+        for tupla in df[colunas].itertuples(index=False, name=None):
+            por_coluna = dict(zip(colunas, tupla))
+            valores = [_valor_celula(por_coluna.get(col)) for col in all_columns]
+            if valores[idx_registro] is not None:
+                valores[idx_registro] = str(valores[idx_registro])
+            yield valores
+    return len(df), gerar()
+
+
+class _EscritorExcel:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        # write_only grava as linhas em disco à medida que são acrescentadas
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        self.ws.append(all_columns)
+
+    def escrever(self, valores):
+        self.ws.append(valores)
+
+    def fechar(self):
+        self.wb.save(self.caminho)
+
+
+class _EscritorCSV:
+    def __init__(self, caminho):
+        # utf-8-sig para que o Excel reconheça os acentos ao abrir o CSV
+        self.arquivo = open(caminho, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.arquivo, delimiter=';')
+        self.writer.writerow(all_columns)
+
+    def escrever(self, valores):
+        self.writer.writerow(['' if v is None else v for v in valores])
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class _EscritorParquet:
+    def __init__(self, caminho):
+        self.schema = pa.schema([(col, pa.string()) for col in all_columns])
+        self.writer = pq.ParquetWriter(caminho, self.schema)
+        self.lote = []
+
+    def escrever(self, valores):
+        self.lote.append(valores)
+        if len(self.lote) >= TAMANHO_LOTE:
+            self._gravar_lote()
+
+    def _gravar_lote(self):
+        if not self.lote:
+            return
+        colunas = list(zip(*self.lote))
+        dados = {col: [None if v is None else str(v) for v in colunas[i]] for i, col in enumerate(all_columns)}
+        self.writer.write_table(pa.Table.from_pydict(dados, schema=self.schema))
+        self.lote = []
+
+    def fechar(self):
+        self._gravar_lote()
+        self.writer.close()
+
+
+_ESCRITORES = {'xlsx': _EscritorExcel, 'csv': _EscritorCSV, 'parquet': _EscritorParquet}
+
+
+def exportar(fonte, caminho, formato='xlsx', progresso=None, cancelar=None):
+    """Grava as linhas de 'fonte' (tupla (total, gerador)) em 'caminho' no formato indicado.
+    'progresso(feitas, total)' é chamado a cada lote; 'cancelar' é um threading.Event opcional.
+    Retorna o número de linhas gravadas.
+    """
+    if formato not in formatos_disponiveis():
+        raise ValueError(f"Formato de exportação indisponível: {formato}")
+    total, linhas = fonte
+    temporario = f"{caminho}.parcial"
+    feitas = 0
+    with diagnostico.medir(f'exportacao.{formato}', caminho):
+        escritor = _ESCRITORES[formato](temporario)
+        try:
+            for valores in linhas:
+                escritor.escrever(valores)
+                feitas += 1
+                if feitas % TAMANHO_LOTE == 0:
+                    if cancelar is not None and cancelar.is_set():
+                        raise ExportacaoCancelada()
+                    if progresso:
+                        progresso(feitas, max(total, feitas))
+            escritor.fechar()
+        except BaseException:
+            try:
+                escritor.fechar()
+            except Exception:
+                pass
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        finally:
+            close = getattr(linhas, 'close', None)
+            if close:
+                close()
+    os.replace(temporario, caminho)
+    diagnostico.contar('exportacao.linhas', feitas)
+    if progresso:
+        progresso(feitas, feitas)
+    return feitas
@@ -0,0 +1,220 @@
+"""Índice ordenado de número de chamada ('Classificação - CDU' + 'Cutter') para consultas de estante.
+
+Cada número da CDU é convertido numa chave de texto cuja ordem alfabética segue a
+ordem de arquivamento da CDU: os algarismos do número principal comparam como
+fração decimal (869 < 869.0 < 869.01 < 87), e as auxiliares vêm logo após o
+número a que se aplicam, antes das subdivisões dele, na ordem
++ / : = (0) (1/9) (=) "" * A-Z - '. Com isso, "tudo sob 869.0(81)" é o
+intervalo de chaves que começam com a chave de 869.0(81), encontrado por busca
+binária (bisect) numa lista ordenada.
+"""
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+import pandas as pd
+
+import diagnostico
+
+# Marcadores das auxiliares, em ordem de arquivamento (todos menores que os algarismos)
+_ORDEM_AUXILIARES = ['+', '/', ':', '=', '(0', '(', '(=', '"', '*', 'A', '-', "'"]
+_MARCADOR = {aux: chr(0x10 + i) for i, aux in enumerate(_ORDEM_AUXILIARES)}
+# Fecha uma auxiliar: menor que qualquer outro caractere da chave
+_FIM = '\x01'
+# Maior que qualquer caractere da chave: limite superior das subárvores
+_MAXIMO = '\uffff'
+
+
+def _sem_acentos(texto):
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+
+
+def _normalizar_cdu(cdu):
+    if cdu is None or (isinstance(cdu, float) and pd.isna(cdu)):
+        return ''
+    texto = _sem_acentos(str(cdu)).upper()
+    for aspas in '“”«»':
+        texto = texto.replace(aspas, '"')
+    return ''.join(texto.split())
+
+
+def _algarismos(texto, inicio):
+    """Lê algarismos (ignorando os pontos separadores) a partir de 'inicio'. Retorna (algarismos, fim)."""
+    fim = inicio
+    while fim < len(texto) and (texto[fim].isdigit() or texto[fim] == '.'):
+        fim += 1
+    return texto[inicio:fim].replace('.', ''), fim
+
+
+def _codificar(texto):
+    partes = []
+    i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c.isdigit() or c == '.':
+            numero, i = _algarismos(texto, i)
+            partes.append(numero)
+        elif c == '(':
+            fim = texto.find(')', i)
+            fim = len(texto) if fim < 0 else fim
+            interno = texto[i + 1:fim]
+            if interno.startswith('='):
+                marcador, interno = _MARCADOR['(='], interno[1:]
+            elif interno.startswith('0'):
+                marcador = _MARCADOR['(0']
+            else:
+                marcador = _MARCADOR['(']
+            partes.append(marcador + _codificar(interno) + _FIM)
+            i = fim + 1
+        elif c == '"':
+            fim = texto.find('"', i + 1)
+            fim = len(texto) if fim < 0 else fim
+            partes.append(_MARCADOR['"'] + _codificar(texto[i + 1:fim]) + _FIM)
+            i = fim + 1
+        elif c in '=-\'':
+            numero, i = _algarismos(texto, i + 1)
+            partes.append(_MARCADOR[c] + numero + _FIM)
+        elif c in '+/:*':
+            # Relação, adição e extensão ligam outro número, codificado em seguida
+            while i < len(texto) and texto[i] == c:
+                i += 1
+            partes.append(_MARCADOR[c])
+        elif c.isalpha():
+            fim = i
+            while fim < len(texto) and texto[fim].isalpha():
+                fim += 1
+            partes.append(_MARCADOR['A'] + texto[i:fim] + _FIM)
+            i = fim
+        else:
+            i += 1
+    return ''.join(partes)
+
+
+def chave_cdu(cdu):
+    """Chave de ordenação da CDU; '' se o campo estiver vazio."""
+    return _codificar(_normalizar_cdu(cdu))
+
+
+def chave_cutter(cutter):
+    """Chave de ordenação da notação de autor (ex.: 'R175v' -> ('R', '175', 'v')).
+    O número compara como fração decimal e a marca da obra vem depois dele, de modo que
+    R175 < R175a < R1751.
+    """
+    if cutter is None or (isinstance(cutter, float) and pd.isna(cutter)):
+        return ('', '', '')
+    texto = ''.join(_sem_acentos(str(cutter)).split()).replace('.', '')
+    i = 0
+    while i < len(texto) and texto[i].isalpha():
+        i += 1
+    fim = i
+    while fim < len(texto) and texto[fim].isdigit():
+        fim += 1
+    return (texto[:i].upper(), texto[i:fim], texto[fim:].lower())
+
+
+def _prefixo_subarvore(cdu):
+    # Sem o fechamento da última auxiliar, (81) também alcança (811), (813.3)...
+    return chave_cdu(cdu).rstrip(_FIM)
+
+
+class IndiceCDU:
+    """Lista ordenada de (chave_cdu, chave_cutter, tipologia, registro).
+
+    Registros sem 'Classificação - CDU' não entram no índice. Consultas retornam
+    pares (tipologia, registro) em ordem de estante.
+    """
+
+    def __init__(self):
+        self._chaves = []
+        self._por_registro = {}  # (tipologia, registro) -> chave
+        self.construido = False
+
+    def __len__(self):
+        return len(self._chaves)
+
+    def construir(self, df):
+        """Reconstrói o índice a partir de um DataFrame do catálogo (ordenação única, O(n log n))."""
+        with diagnostico.medir('indice_cdu.construir'):
+            self._por_registro = {}
+            for tipologia, registro, cdu, cutter in df[['Tipologia', 'Registro', 'Classificação - CDU', 'Cutter']].itertuples(index=False, name=None):
+                chave_c = chave_cdu(cdu)
+                if chave_c:
+                    par = (tipologia, str(registro))
+                    self._por_registro[par] = (chave_c, chave_cutter(cutter)) + par
+            self._chaves = sorted(self._por_registro.values())
+            self.construido = True
+
+    def remover(self, tipologia, registro):
+        chave = self._por_registro.pop((tipologia, str(registro)), None)
+        if chave is not None:
+            posicao = bisect_left(self._chaves, chave)
+            if posicao < len(self._chaves) and self._chaves[posicao] == chave:
+                del self._chaves[posicao]
+
+    def atualizar(self, tipologia, registro, linha):
+        """Atualiza o registro no índice; 'linha' None (exclusão) apenas o remove."""
+        self.remover(tipologia, registro)
+        if linha is None:
+            return
+        chave_c = chave_cdu(linha.get('Classificação - CDU'))
+        if not chave_c:
+            return
+        par = (tipologia, str(registro))
+        chave = (chave_c, chave_cutter(linha.get('Cutter'))) + par
+        self._por_registro[par] = chave
+        insort(self._chaves, chave)
+
+    def substituir_tipologia(self, tipologia, df_tipologia):
+        """Troca as entradas de uma tipologia (ex.: planilha recarregada após alteração externa)."""
+        for par in [p for p in self._por_registro if p[0] == tipologia]:
+            del self._por_registro[par]
+        self._chaves = [c for c in self._chaves if c[2] != tipologia]
+        novas = []
+        for registro, cdu, cutter in df_tipologia[['Registro', 'Classificação - CDU', 'Cutter']].itertuples(index=False, name=None):
+            chave_c = chave_cdu(cdu)
+            if chave_c:
+                par = (tipologia, str(registro))
+                self._por_registro[par] = (chave_c, chave_cutter(cutter)) + par
+                novas.append(self._por_registro[par])
+        self._chaves = sorted(self._chaves + novas)
+
+    def _pares(self, inicio, fim):
+        return [(c[2], c[3]) for c in self._chaves[inicio:fim]]
+
+    def subarvore(self, cdu):
+        """Registros classificados em 'cdu' ou em qualquer subdivisão dela, em ordem de estante."""
+        prefixo = _prefixo_subarvore(cdu)
+        inicio = bisect_left(self._chaves, (prefixo,))
+        fim = bisect_left(self._chaves, (prefixo + _MAXIMO,))
+        return self._pares(inicio, fim)
+
+    def intervalo(self, inicio, fim, cutter_inicio=None, cutter_fim=None):
+        """Registros de 'inicio' até 'fim' (inclusive, com as subdivisões de 'fim'), em ordem de estante.
+        'cutter_inicio'/'cutter_fim' restringem o intervalo dentro das classificações das pontas.
+        """
+        if inicio:
+            limite = (chave_cdu(inicio),) if cutter_inicio is None else (chave_cdu(inicio), chave_cutter(cutter_inicio))
+            a = bisect_left(self._chaves, limite)
+        else:
+            a = 0
+        if fim:
+            if cutter_fim is None:
+                b = bisect_left(self._chaves, (_prefixo_subarvore(fim) + _MAXIMO,))
+            else:
+                b = bisect_right(self._chaves, (chave_cdu(fim), chave_cutter(cutter_fim), _MAXIMO))
+        else:
+            b = len(self._chaves)
+        return self._pares(a, max(a, b))
+
+    def ordem_estante(self, tipologia=None):
+        """Todos os registros indexados (ou só os da tipologia) em ordem de estante."""
+        return [(c[2], c[3]) for c in self._chaves if tipologia is None or c[2] == tipologia]
+
+
+def selecionar(df, pares):
+    """Linhas de 'df' correspondentes aos pares (tipologia, registro), na ordem dos pares."""
+    if not pares:
+        return df.iloc[0:0]
+    ordem = pd.DataFrame(pares, columns=['Tipologia', 'Registro'])
+    chaves = df[['Tipologia', 'Registro']].astype(str).reset_index()
+    posicoes = ordem.merge(chaves, on=['Tipologia', 'Registro'], how='inner')['index']
+    return df.loc[posicoes]
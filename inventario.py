@@ -0,0 +1,187 @@
+"""Modo inventário: conferência das estantes a partir de lotes de 'Registro' lidos.
+
+Cada lote (números digitados, colados, lidos por leitor de código de barras ou
+carregados de um arquivo) é associado à localização conferida e gravado na hora
+como uma linha de um arquivo JSONL da sessão, de modo que um inventário de vários
+dias sobrevive a um reinício. A conciliação monta um índice (dicionário) do
+catálogo por 'Registro' e classifica as leituras com operações de conjunto:
+faltando (cadastrado na localização conferida e não lido), fora do lugar (lido em
+outra localização) e desconhecido (número sem cadastro).
+"""
+import csv
+import json
+import os
+import re
+from datetime import datetime
+
+import diagnostico
+from autocompletar import chave_texto
+
+PASTA_INVENTARIO = 'inventario'
+
+
+def normalizar_registro(registro):
+    """'42', '0042' e '00042' identificam o mesmo 'Registro'."""
+    texto = str(registro).strip()
+    return str(int(texto)) if texto.isdigit() else texto.upper()
+
+
+def ler_registros(texto):
+    """Separa os números lidos (um por linha, ou separados por espaço, vírgula, ponto e vírgula ou tabulação)."""
+    return [parte for parte in re.split(r'[\s,;]+', texto) if parte]
+
+
+def ler_arquivo_registros(caminho):
+    """Lê os números de um arquivo de texto/CSV exportado pelo leitor de código de barras."""
+    with open(caminho, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return ler_registros(f.read())
+
+
+def caminho_nova_sessao(pasta=PASTA_INVENTARIO):
+    return os.path.join(pasta, f"inventario_{datetime.now():%Y%m%d-%H%M%S}.jsonl")
+
+
+def ultima_sessao(pasta=PASTA_INVENTARIO):
+    """Arquivo da sessão mais recente, ou None."""
+    if not os.path.isdir(pasta):
+        return None
+    sessoes = sorted(nome for nome in os.listdir(pasta) if nome.endswith('.jsonl'))
+    return os.path.join(pasta, sessoes[-1]) if sessoes else None
+
+
+class SessaoInventario:
+    """Lotes lidos numa sessão de inventário, gravados de forma incremental em JSONL."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lotes = []
+        self._quebra_pendente = False
+        if os.path.exists(caminho):
+            self._carregar()
+
+    def _carregar(self):
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            for numero, linha in enumerate(f, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    self.lotes.append(json.loads(linha))
+                except json.JSONDecodeError:
+                    # Última linha cortada por uma queda durante a gravação
+                    print(f"AVISO: Linha {numero} ilegível na sessão de inventário '{self.caminho}'; ignorada.")
+                # O próximo lote não pode continuar uma linha cortada
+                self._quebra_pendente = not linha.endswith('\n')
+
+    def registrar_lote(self, registros, localizacao, tipologia=None):
+        """Acrescenta um lote à sessão e o grava imediatamente no disco. Retorna o lote."""
+        lote = {
+            'lote': len(self.lotes) + 1,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'localizacao': localizacao.strip(),
+            'tipologia': tipologia or None,
+            'registros': [str(r).strip() for r in registros if str(r).strip()],
+        }
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            f.write(('\n' if self._quebra_pendente else '') + json.dumps(lote, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._quebra_pendente = False
+        self.lotes.append(lote)
+        diagnostico.contar('inventario.leituras', len(lote['registros']))
+        return lote
+
+    def total_leituras(self):
+        return sum(len(lote['registros']) for lote in self.lotes)
+
+    def locais_lidos(self):
+        return {chave_texto(lote['localizacao']) for lote in self.lotes}
+
+
+def indexar_catalogo(df):
+    """Índice Registro normalizado -> [(tipologia, registro, localizacao)].
+    O mesmo número pode existir em tipologias diferentes (cada uma tem sua sequência).
+    """
+    indice = {}
+    colunas = zip(df['Tipologia'].tolist(), df['Registro'].astype(str).tolist(), df['Localização'].tolist())
+    for tipologia, registro, localizacao in colunas:
+        localizacao = '' if localizacao is None or localizacao != localizacao else str(localizacao)
+        indice.setdefault(normalizar_registro(registro), []).append((tipologia, registro, localizacao))
+    return indice
+
+
+def _resolver(candidatos, tipologia, local_lido):
+    """Escolhe o item lido entre os cadastrados com o mesmo número; None se for ambíguo."""
+    if tipologia:
+        candidatos = [c for c in candidatos if c[0] == tipologia]
+    if len(candidatos) > 1:
+        no_local = [c for c in candidatos if chave_texto(c[2]) == local_lido]
+        candidatos = no_local if len(no_local) == 1 else candidatos
+    return candidatos[0] if len(candidatos) == 1 else None
+
+
+def conciliar(df, sessao, apenas_locais_lidos=True):
+    """Confere as leituras da sessão contra o catálogo 'df'.
+
+    Retorna um dicionário com:
+      'faltando': [(tipologia, registro, localizacao)] cadastrados e não lidos
+        (só das localizações conferidas, se 'apenas_locais_lidos');
+      'fora_do_lugar': [(tipologia, registro, localizacao_cadastrada, localizacao_lida)];
+      'desconhecidos': [(numero, localizacao_lida)] sem cadastro;
+      'ambiguos': [(numero, localizacao_lida)] cadastrados em mais de uma tipologia;
+      'esperados' e 'encontrados': totais.
+    Um item lido mais de uma vez vale pela última leitura.
+    """
+    with diagnostico.medir('inventario.conciliar'):
+        indice = indexar_catalogo(df)
+        lidos = {}  # (tipologia, registro) -> localização onde foi lido por último
+        desconhecidos = {}
+        ambiguos = {}
+        for lote in sessao.lotes:
+            local_lido = chave_texto(lote['localizacao'])
+            for numero in lote['registros']:
+                candidatos = indice.get(normalizar_registro(numero))
+                if not candidatos:
+                    desconhecidos[numero] = lote['localizacao']
+                    continue
+                item = _resolver(candidatos, lote.get('tipologia'), local_lido)
+                if item is None:
+                    ambiguos[numero] = lote['localizacao']
+                    continue
+                lidos[item] = lote['localizacao']
+
+        locais = sessao.locais_lidos()
+        esperados = {item for itens in indice.values() for item in itens
+                     if not apenas_locais_lidos or chave_texto(item[2]) in locais}
+        encontrados = set(lidos)
+        faltando = esperados - encontrados
+        fora_do_lugar = {item for item in encontrados if chave_texto(item[2]) != chave_texto(lidos[item])}
+    return {
+        'faltando': sorted(faltando, key=lambda i: (chave_texto(i[2]), i[0], i[1])),
+        'fora_do_lugar': sorted(((t, r, loc, lidos[(t, r, loc)]) for t, r, loc in fora_do_lugar),
+                                key=lambda i: (chave_texto(i[3]), i[0], i[1])),
+        'desconhecidos': sorted(desconhecidos.items(), key=lambda i: (chave_texto(i[1]), i[0])),
+        'ambiguos': sorted(ambiguos.items(), key=lambda i: (chave_texto(i[1]), i[0])),
+        'esperados': len(esperados),
+        'encontrados': len(encontrados & esperados),
+    }
+
+
+def linhas_relatorio(resultado):
+    """Linhas (situação, tipologia, registro, localização cadastrada, localização lida) do relatório."""
+    for tipologia, registro, localizacao in resultado['faltando']:
+        yield ('Faltando', tipologia, registro, localizacao, '')
+    for tipologia, registro, localizacao, lida in resultado['fora_do_lugar']:
+        yield ('Fora do lugar', tipologia, registro, localizacao, lida)
+    for numero, lida in resultado['desconhecidos']:
+        yield ('Desconhecido', '', numero, '', lida)
+    for numero, lida in resultado['ambiguos']:
+        yield ('Ambíguo (informe a tipologia)', '', numero, '', lida)
+
+
+def exportar_relatorio(resultado, caminho):
+    """Grava o relatório da conciliação em CSV (';', UTF-8 com BOM, como a exportação geral)."""
+    with open(caminho, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Situação', 'Tipologia', 'Registro', 'Localização cadastrada', 'Localização lida'])
+        writer.writerows(linhas_relatorio(resultado))
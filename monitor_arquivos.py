@@ -0,0 +1,214 @@
+"""Monitoramento de alterações externas nas planilhas (ex.: edição direta no Excel).
+
+Usa inotify no Linux (via ctypes, sem dependências extras) e, nos demais
+sistemas, se o inotify não estiver disponível ou se as planilhas estiverem numa
+pasta de rede (NFS/CIFS, onde o inotify não vê as gravações de outras máquinas),
+uma verificação periódica de data de modificação e tamanho. Os eventos são agrupados (debounce), porque o
+Excel grava o arquivo em várias etapas, e as gravações feitas pelo próprio
+sistema são ignoradas.
+"""
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+
+import catalogo
+from bloqueio import versao_arquivo as assinatura
+
+# Máscaras do inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+_MASCARA = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENTO = struct.Struct('iIII')
+# Sistemas de arquivos de rede: o inotify só vê as gravações feitas pela própria máquina
+SISTEMAS_DE_REDE = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs', 'ceph', 'glusterfs', '9p',
+                    'fuse.sshfs', 'fuse.glusterfs', 'fuse.cephfs'}
+
+
+def sistema_de_arquivos(pasta):
+    """Tipo do sistema de arquivos que contém 'pasta' (Linux, via /proc/self/mounts), ou None."""
+    pasta = os.path.realpath(pasta)
+    melhor, tipo = '', None
+    try:
+        with open('/proc/self/mounts', 'r', encoding='utf-8', errors='replace') as f:
+            linhas = f.read().splitlines()
+    except OSError:
+        return None
+    for linha in linhas:
+        partes = linha.split()
+        if len(partes) < 3:
+            continue
+        # Espaços e outros caracteres vêm codificados em octal (ex.: '\040')
+        ponto = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), partes[1])
+        dentro = pasta == ponto or pasta.startswith(ponto.rstrip('/') + '/')
+        if dentro and len(ponto) >= len(melhor):
+            melhor, tipo = ponto, partes[2]
+    return tipo
+
+
+class _Inotify:
+    """Observa diretórios com inotify e devolve os caminhos alterados."""
+
+    def __init__(self, pastas):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 falhou')
+        self.pastas = {}
+        for pasta in pastas:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(pasta), _MASCARA)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch falhou para {pasta}')
+            self.pastas[wd] = pasta
+
+    def coletar(self, timeout):
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return set()
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        alterados = set()
+        pos = 0
+        while pos + _EVENTO.size <= len(dados):
+            wd, _mascara, _cookie, tamanho = _EVENTO.unpack_from(dados, pos)
+            pos += _EVENTO.size
+            nome = dados[pos:pos + tamanho].rstrip(b'\0')
+            pos += tamanho
+            if nome and wd in self.pastas:
+                alterados.add(os.path.join(self.pastas[wd], os.fsdecode(nome)))
+        return alterados
+
+    def fechar(self):
+        os.close(self.fd)
+
+
+class _Polling:
+    """Alternativa portátil: compara data de modificação e tamanho periodicamente."""
+
+    def __init__(self, obter_arquivos, intervalo):
+        self.obter_arquivos = obter_arquivos
+        self.intervalo = intervalo
+        self.vistos = {c: assinatura(c) for c in obter_arquivos()}
+        self.parar = threading.Event()
+
+    def coletar(self, timeout):
+        # Nunca espera mais que o intervalo de verificação
+        self.parar.wait(min(timeout, self.intervalo))
+        alterados = set()
+        for caminho in self.obter_arquivos():
+            atual = assinatura(caminho)
+            if atual != self.vistos.get(caminho):
+                self.vistos[caminho] = atual
+                alterados.add(caminho)
+        return alterados
+
+    def fechar(self):
+        self.parar.set()
+
+
+class MonitorArquivos:
+    """Observa as planilhas e chama 'ao_alterar(caminho)' (na thread do monitor) após o debounce.
+
+    'obter_arquivos' retorna a lista atual de caminhos observados; é consultada a cada
+    evento, de modo que novos arquivos (ex.: segmentos) passam a ser observados sem reinício.
+    """
+
+    def __init__(self, obter_arquivos, ao_alterar, atraso=1.0, intervalo_polling=2.0, usar_inotify=True):
+        self.obter_arquivos = obter_arquivos
+        self.ao_alterar = ao_alterar
+        self.atraso = atraso
+        self.intervalo_polling = intervalo_polling
+        self.usar_inotify = usar_inotify and sys.platform.startswith('linux')
+        self.backend = None
+        self._assinaturas = {}
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        arquivos = [os.path.abspath(c) for c in self.obter_arquivos()]
+        with self._lock:
+            self._assinaturas = {c: assinatura(c) for c in arquivos}
+        backend = None
+        if self.usar_inotify:
+            try:
+                pastas = sorted({os.path.dirname(c) for c in arquivos} or {os.path.abspath('')})
+                rede = sorted({t for t in map(sistema_de_arquivos, pastas) if t in SISTEMAS_DE_REDE})
+                if rede:
+                    print(f"AVISO: Planilhas numa pasta de rede ({', '.join(rede)}); usando verificação periódica.")
+                else:
+                    backend = _Inotify(pastas)
+                    self.backend = 'inotify'
+            except Exception as e:
+                print(f"AVISO: inotify indisponível, usando verificação periódica: {e}")
+        if backend is None:
+            backend = _Polling(lambda: [os.path.abspath(c) for c in self.obter_arquivos()], self.intervalo_polling)
+            self.backend = 'polling'
+        self._thread = threading.Thread(target=self._executar, args=(backend,), name='MonitorArquivos', daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def registrar_gravacao_propria(self, caminho):
+        """Atualiza a assinatura conhecida após uma gravação feita pelo próprio sistema."""
+        caminho = os.path.abspath(caminho)
+        with self._lock:
+            self._assinaturas[caminho] = assinatura(caminho)
+            self._pendentes.pop(caminho, None)
+
+    def _executar(self, backend):
+        try:
+            while not self._parar.is_set():
+                agora = time.monotonic()
+                with self._lock:
+                    proximo = min(self._pendentes.values(), default=agora + 0.5)
+                alterados = backend.coletar(max(0.05, min(proximo - agora, 0.5)))
+                observados = {os.path.abspath(c) for c in self.obter_arquivos()}
+                agora = time.monotonic()
+                with self._lock:
+                    for caminho in alterados & observados:
+                        # Reinicia a espera a cada novo evento do mesmo arquivo
+                        self._pendentes[caminho] = agora + self.atraso
+                    vencidos = [c for c, prazo in self._pendentes.items() if prazo <= agora]
+                    for caminho in vencidos:
+                        del self._pendentes[caminho]
+                for caminho in vencidos:
+                    atual = assinatura(caminho)
+                    with self._lock:
+                        if atual == self._assinaturas.get(caminho):
+                            continue
+                        self._assinaturas[caminho] = atual
+                    try:
+                        self.ao_alterar(caminho)
+                    except Exception as e:
+                        print(f"AVISO: Falha ao processar alteração em '{caminho}': {e}")
+        finally:
+            backend.fechar()
+
+
+def arquivos_tipologias(pasta=''):
+    """Mapeia o caminho absoluto de cada planilha de tipologia para a sua tipologia.
+    Inclui o manifesto e os segmentos das tipologias particionadas.
+    """
+    arquivos = {}
+    for t in catalogo.tipologias:
+        caminhos = [catalogo.get_filename_for_tipologia(t, pasta), catalogo.caminho_manifesto(t, pasta)]
+        for caminho in caminhos + catalogo.arquivos_da_tipologia(t, pasta):
+            arquivos[os.path.abspath(caminho)] = t
+    return arquivos
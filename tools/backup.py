@@ -0,0 +1,61 @@
+"""Cópias de segurança do catálogo pela linha de comando.
+
+Uso (a partir da pasta das planilhas):
+    python tools/backup.py criar
+    python tools/backup.py listar
+    python tools/backup.py restaurar Livro --em "2024-05-10 18:00"
+    python tools/backup.py podar --manter 30
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup  # noqa: E402
+import catalogo  # noqa: E402
+
+
+def listar(pasta_backups):
+    for identificador in backup.listar_instantaneos(pasta_backups):
+        instantaneo = backup.ler_instantaneo(identificador, pasta_backups)
+        total = sum(e['linhas'] for e in instantaneo['tipologias'].values())
+        alteradas = ', '.join(instantaneo.get('alteradas', [])) or '-'
+        print(f"{identificador}  {total:>8} registros  alteradas: {alteradas}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cópias de segurança incrementais do catálogo.')
+    parser.add_argument('--pasta', default='', help='Pasta das planilhas (padrão: pasta atual).')
+    parser.add_argument('--backups', default=backup.PASTA_BACKUPS, help='Pasta das cópias de segurança.')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('criar', help='Cria uma cópia das planilhas alteradas.')
+    comandos.add_parser('listar', help='Lista as cópias existentes.')
+    restaurar = comandos.add_parser('restaurar', help='Restaura uma tipologia.')
+    restaurar.add_argument('tipologia', choices=catalogo.tipologias)
+    restaurar.add_argument('--em', default=None, help='Data/hora "AAAA-MM-DD HH:MM" (padrão: a cópia mais recente).')
+    podar = comandos.add_parser('podar', help='Remove cópias antigas e blocos sem uso.')
+    podar.add_argument('--manter', type=int, required=True, help='Quantidade de cópias mais recentes a manter.')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.comando == 'criar':
+            identificador = backup.criar_instantaneo(args.pasta, args.backups)
+            print(f"Cópia {identificador} criada." if identificador else "Nada mudou desde a última cópia.")
+        elif args.comando == 'listar':
+            listar(args.backups)
+        elif args.comando == 'restaurar':
+            instante = datetime.fromisoformat(args.em) if args.em else None
+            identificador = backup.restaurar_tipologia(args.tipologia, instante, args.pasta, args.backups)
+            print(f"'{args.tipologia}' restaurada a partir da cópia {identificador}.")
+        else:
+            instantaneos, blocos = backup.podar(args.manter, args.backups)
+            print(f"{instantaneos} cópia(s) e {blocos} bloco(s) removidos.")
+    except catalogo.CatalogoError as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
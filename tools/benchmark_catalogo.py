@@ -0,0 +1,316 @@
+"""Benchmark das operações principais do catálogo, sem interface gráfica.
+
+Gera catálogos sintéticos (distribuídos pelas nove tipologias, com autores e
+títulos acentuados), mede a latência de cada operação e o pico de memória e
+grava o resultado em JSON para comparação entre commits.
+
+Uso (a partir da raiz do projeto):
+    python tools/benchmark_catalogo.py --tamanhos 1000,10000
+    python tools/benchmark_catalogo.py --tamanhos 100000 --particionar 5000
+    python tools/benchmark_catalogo.py --comparar antes.json depois.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd  # noqa: E402
+
+import catalogo  # noqa: E402
+import autocompletar  # noqa: E402
+import exportacao  # noqa: E402
+import indice_cdu  # noqa: E402
+
+PASTA_DADOS = os.path.join(RAIZ, 'benchmarks', 'dados')
+PASTA_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+
+# Proporção aproximada de cada tipologia num acervo real
+PESOS_TIPOLOGIA = {
+    'Livro': 55, 'Folhetos': 10, 'Multimeios': 5, 'Periódicos': 10, 'Plaquetes': 3,
+    'Obras Raras': 2, 'Folhetos de Cordel': 8, 'Obra de Referência': 4, 'Outros': 3,
+}
+
+NOMES = ['João', 'José', 'Antônio', 'Conceição', 'Inês', 'Luís', 'Sebastião', 'Fátima', 'Cícero', 'Graça',
+         'Mônica', 'Zé', 'Irene', 'Ariano', 'Raquel', 'Cecília', 'Cândido', 'Álvaro', 'Ângela', 'Têca']
+SOBRENOMES = ['Araújo', 'Brandão', 'Gonçalves', 'Conceição', 'Magalhães', 'Simões', 'Falcão', 'Guimarães', 'Assunção',
+              'Queiroz', 'Suassuna', 'Lins do Rêgo', 'Câmara', 'Limeira', 'Ramos', 'Meireles', 'Almeida', 'Brasileiro']
+PALAVRAS_TITULO = ['sertão', 'memórias', 'coração', 'história', 'paraíba', 'cantoria', 'viola', 'saudade', 'ação',
+                   'nação', 'poesia', 'educação', 'açude', 'estação', 'lições', 'canção', 'órfão', 'mãe', 'João Pessoa',
+                   'caatinga', 'catedral', 'república', 'política', 'música', 'épico', 'crônicas', 'ausência']
+EDITORAS = ['Editora Universitária', 'Ideia', 'Companhia das Letras', 'José Olympio', 'Ática', 'Record', 'Edições Câmara',
+            'Grafset', 'A União', 'Vozes', 'Cortez', 'Paz e Terra']
+LOCAIS = ['João Pessoa', 'Campina Grande', 'São Paulo', 'Rio de Janeiro', 'Recife', 'Brasília', 'Petrópolis', 'Natal']
+ASSUNTOS = ['Literatura brasileira', 'Literatura de cordel', 'História da Paraíba', 'Educação', 'Música popular',
+            'Política', 'Religião', 'Geografia', 'Poesia', 'Ciências sociais']
+CDUS = ['869.0(81)', '869.0(813.3)-1', '94(813.3)', '37.01', '78.067', '32(81)', '2-475', '91(81)', '821.134.3', '316']
+ORIGENS = ['Doação', 'Compra', 'Permuta', 'Depósito legal']
+
+
+def _texto_titulo(rng):
+    return ' '.join(rng.choice(PALAVRAS_TITULO) for _ in range(rng.randint(2, 6))).capitalize()
+
+
+def gerar_registros(rng, tipologia, quantidade):
+    """Gera 'quantidade' registros sintéticos de uma tipologia."""
+    registros = []
+    for n in range(1, quantidade + 1):
+        sobrenome = rng.choice(SOBRENOMES)
+        registros.append({
+            'Data': f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1990, 2025)}",
+            'Registro': str(n).zfill(5),
+            'Autor': f"{sobrenome.upper()}, {rng.choice(NOMES)}",
+            'Título': _texto_titulo(rng),
+            'Local': rng.choice(LOCAIS),
+            'Editora': rng.choice(EDITORAS),
+            'Edição': f"{rng.randint(1, 9)}. ed.",
+            'Volume': rng.choice(['', rng.randint(1, 5)]),
+            'Número': rng.choice(['', rng.randint(1, 300)]),
+            'Ano': rng.randint(1900, 2025),
+            'Exemplar': f"ex. {rng.randint(1, 3)}",
+            'Quantidade': rng.randint(1, 4),
+            'Origem': rng.choice(ORIGENS),
+            'Cutter': f"{sobrenome[0].upper()}{rng.randint(100, 999)}{rng.choice('abcdefghijklmnopqrstuvwxyz')}",
+            'Classificação - CDU': rng.choice(CDUS),
+            'Assuntos': '; '.join(rng.sample(ASSUNTOS, rng.randint(1, 3))),
+            'Localização': f"Estante {rng.randint(1, 40)} - Prateleira {rng.randint(1, 6)}",
+            'Tipologia': tipologia,
+            'Observação': rng.choice(['', '', 'Exemplar com dedicatória do autor.', 'Capa danificada.']),
+        })
+    return registros
+
+
+def gerar_catalogo(pasta, tamanho, semente=42):
+    """Grava em 'pasta' um catálogo sintético de 'tamanho' registros distribuídos pelas tipologias."""
+    rng = random.Random(semente)
+    os.makedirs(pasta, exist_ok=True)
+    total_pesos = sum(PESOS_TIPOLOGIA.values())
+    restantes = tamanho
+    for i, tipologia in enumerate(catalogo.tipologias):
+        if i == len(catalogo.tipologias) - 1:
+            quantidade = restantes
+        else:
+            quantidade = tamanho * PESOS_TIPOLOGIA[tipologia] // total_pesos
+        restantes -= quantidade
+        if quantidade <= 0:
+            continue
+        df = pd.DataFrame(gerar_registros(rng, tipologia, quantidade), columns=catalogo.all_columns)
+        catalogo.gravar_planilha(df, catalogo.get_filename_for_tipologia(tipologia, pasta))
+
+
+def _pasta_catalogo(tamanho, semente):
+    """Retorna a pasta do catálogo sintético em cache, gerando-o se necessário."""
+    pasta = os.path.join(PASTA_DADOS, f'{tamanho}_{semente}')
+    marcador = os.path.join(pasta, '.completo')
+    if not os.path.exists(marcador):
+        shutil.rmtree(pasta, ignore_errors=True)
+        inicio = time.perf_counter()
+        gerar_catalogo(pasta, tamanho, semente)
+        with open(marcador, 'w', encoding='utf-8') as f:
+            f.write(str(time.perf_counter() - inicio))
+        print(f"  catálogo sintético de {tamanho} registros gerado em {time.perf_counter() - inicio:.1f}s")
+    return pasta
+
+
+def _percentil(valores, p):
+    """Percentil com interpolação linear (p entre 0 e 100)."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    k = (len(ordenados) - 1) * p / 100.0
+    inf = int(k)
+    sup = min(inf + 1, len(ordenados) - 1)
+    return ordenados[inf] + (ordenados[sup] - ordenados[inf]) * (k - inf)
+
+
+def _medir(funcao, repeticoes, preparar=None):
+    """Executa 'funcao' repetidas vezes e retorna (amostras em segundos, pico de memória em bytes).
+    O pico é medido numa execução extra sob tracemalloc, para não distorcer as latências.
+    """
+    amostras = []
+    for i in range(repeticoes):
+        args = preparar(i) if preparar else ()
+        inicio = time.perf_counter()
+        funcao(*args)
+        amostras.append(time.perf_counter() - inicio)
+    args = preparar(repeticoes) if preparar else ()
+    tracemalloc.start()
+    try:
+        funcao(*args)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return amostras, pico
+
+
+def _operacoes(pasta):
+    """Monta as operações medidas, equivalentes às funções da interface."""
+    estado = {'df': catalogo.carregar_catalogo(pasta), 'adicionados': []}
+    termos = ['ramos', 'sertão', '00042', 'coração da paraíba', 'inexistente']
+    classes = [('869.0(81)', None), ('9', None), ('3', '37.01'), ('78', '821')]
+    indice = indice_cdu.IndiceCDU()
+    indice.construir(estado['df'])
+    sugestoes = autocompletar.IndiceSugestoes()
+    sugestoes.construir(estado['df'])
+    digitados = [('Autor', 'a'), ('Autor', 'ara'), ('Editora', 'edit'), ('Local', 'joão p'), ('Assuntos', 'lit')]
+
+    def salvar_dados():
+        dados = {'Título': 'Registro de benchmark', 'Autor': 'ARAÚJO, Conceição', 'Ano': '2024', 'Data': '01/01/2024'}
+        estado['adicionados'].append(catalogo.adicionar_registro('Livro', dados, pasta))
+
+    def atualizar_visualizacao_pesquisa():
+        estado['df'] = catalogo.carregar_catalogo(pasta)
+        # Equivalente ao laço de inserção na Treeview, sem a Treeview
+        for _, row in catalogo.preparar_exibicao(estado['df']).iterrows():
+            list(row)
+
+    def buscar_registro(termo):
+        catalogo.filtrar_catalogo(estado['df'], termo)
+
+    def listar_estante(inicio, fim):
+        pares = indice.subarvore(inicio) if fim is None else indice.intervalo(inicio, fim)
+        indice_cdu.selecionar(estado['df'], pares)
+
+    def autocompletar_campo(campo, texto):
+        sugestoes.sugerir(campo, texto)
+
+    def mover_registro(registro):
+        # Troca a tipologia (Livro -> Folhetos, que já tem planilha) e desfaz; falha se a mudança for recusada
+        catalogo.atualizar_registro('Livro', registro, {'Tipologia': 'Folhetos'}, pasta)
+        catalogo.atualizar_registro('Folhetos', registro, {'Tipologia': 'Livro'}, pasta)
+
+    def excluir_registro(registro):
+        catalogo.remover_registro('Livro', registro, pasta)
+
+    def abrir_planilha_geral():
+        exportacao.exportar(exportacao.fonte_planilhas(pasta), os.path.join(pasta, 'biblioteca_geral.xlsx'))
+
+    return [
+        ('salvar_dados', salvar_dados, None),
+        ('atualizar_visualizacao_pesquisa', atualizar_visualizacao_pesquisa, None),
+        ('buscar_registro', buscar_registro, lambda i: (termos[i % len(termos)],)),
+        ('listar_estante', listar_estante, lambda i: classes[i % len(classes)]),
+        ('autocompletar', autocompletar_campo, lambda i: digitados[i % len(digitados)]),
+        ('mover_registro', mover_registro, lambda i: (estado['adicionados'][i % len(estado['adicionados'])],)),
+        # Exclui os registros acrescentados por salvar_dados, mantendo o catálogo estável
+        ('excluir_registro', excluir_registro, lambda i: (estado['adicionados'].pop(),)),
+        ('abrir_planilha_geral', abrir_planilha_geral, None),
+    ]
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def executar(tamanhos, repeticoes, semente, operacoes_filtro=None, particionar=0):
+    resultados = []
+    for tamanho in tamanhos:
+        print(f"Tamanho {tamanho}:")
+        origem = _pasta_catalogo(tamanho, semente)
+        with tempfile.TemporaryDirectory(prefix='bench_catalogo_') as pasta:
+            for nome in os.listdir(origem):
+                if nome.endswith('.xlsx'):
+                    shutil.copy2(os.path.join(origem, nome), pasta)
+            if particionar:
+                for tipologia in catalogo.tipologias:
+                    if os.path.exists(catalogo.get_filename_for_tipologia(tipologia, pasta)):
+                        catalogo.particionar_tipologia(tipologia, 'registro', particionar, pasta)
+            for nome, funcao, preparar in _operacoes(pasta):
+                if operacoes_filtro and nome not in operacoes_filtro:
+                    continue
+                if nome in ('mover_registro', 'excluir_registro') and operacoes_filtro and 'salvar_dados' not in operacoes_filtro:
+                    print(f"  {nome} ignorado (depende de salvar_dados)")
+                    continue
+                amostras, pico = _medir(funcao, repeticoes, preparar)
+                resultado = {
+                    'tamanho': tamanho,
+                    'operacao': nome,
+                    'amostras_s': [round(a, 6) for a in amostras],
+                    'media_s': sum(amostras) / len(amostras),
+                    'p50_s': _percentil(amostras, 50),
+                    'p90_s': _percentil(amostras, 90),
+                    'p99_s': _percentil(amostras, 99),
+                    'max_s': max(amostras),
+                    'pico_memoria_mb': round(pico / (1024 * 1024), 2),
+                }
+                resultados.append(resultado)
+                print(f"  {nome:<34} p50={resultado['p50_s'] * 1000:9.1f}ms  "
+                      f"p90={resultado['p90_s'] * 1000:9.1f}ms  pico={resultado['pico_memoria_mb']:8.1f}MB")
+    return {
+        'versao': 1,
+        'commit': _commit_atual(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'repeticoes': repeticoes,
+        'semente': semente,
+        'particionar': particionar,
+        'resultados': resultados,
+    }
+
+
+def comparar(arquivo_base, arquivo_novo):
+    """Imprime a variação de p50 e pico de memória entre duas execuções."""
+    with open(arquivo_base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(arquivo_novo, encoding='utf-8') as f:
+        novo = json.load(f)
+    indice_base = {(r['tamanho'], r['operacao']): r for r in base['resultados']}
+    print(f"Base: {base.get('commit')} ({base.get('data')})  Novo: {novo.get('commit')} ({novo.get('data')})")
+    for r in novo['resultados']:
+        b = indice_base.get((r['tamanho'], r['operacao']))
+        if b is None:
+            continue
+        razao = r['p50_s'] / b['p50_s'] if b['p50_s'] else float('inf')
+        print(f"{r['tamanho']:>8} {r['operacao']:<34} p50 {b['p50_s'] * 1000:9.1f} -> {r['p50_s'] * 1000:9.1f}ms "
+              f"({razao:5.2f}x)  pico {b['pico_memoria_mb']:8.1f} -> {r['pico_memoria_mb']:8.1f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark das operações do catálogo.')
+    parser.add_argument('--tamanhos', default='1000,10000,100000,500000',
+                        help='Tamanhos dos catálogos sintéticos, separados por vírgula.')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Execuções medidas por operação.')
+    parser.add_argument('--semente', type=int, default=42, help='Semente do gerador sintético.')
+    parser.add_argument('--operacoes', default='', help='Restringe às operações indicadas (separadas por vírgula).')
+    parser.add_argument('--saida', default=None, help='Arquivo JSON de saída (padrão: benchmarks/resultados/).')
+    parser.add_argument('--particionar', type=int, default=0, metavar='LINHAS',
+                        help='Particiona cada tipologia em segmentos deste tamanho antes de medir.')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NOVO'), help='Compara dois resultados JSON.')
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    tamanhos = [int(t) for t in args.tamanhos.split(',') if t.strip()]
+    operacoes_filtro = {o.strip() for o in args.operacoes.split(',') if o.strip()} or None
+    relatorio = executar(tamanhos, args.repeticoes, args.semente, operacoes_filtro, args.particionar)
+
+    saida = args.saida
+    if saida is None:
+        os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+        carimbo = datetime.now().strftime('%Y%m%d-%H%M%S')
+        saida = os.path.join(PASTA_RESULTADOS, f"{carimbo}_{relatorio['commit'] or 'sem-commit'}.json")
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Divide a planilha de uma tipologia em segmentos descritos por um manifesto.
+
+Os segmentos podem ser por faixa de 'Registro' (a cada N registros) ou por ano do
+campo 'Data'. A planilha original é preservada como '<planilha>.antes_particao'.
+
+Uso (a partir da pasta das planilhas):
+    python tools/particionar.py Livro --criterio registro --tamanho 5000
+    python tools/particionar.py Periódicos --criterio ano
+    python tools/particionar.py --listar
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogo  # noqa: E402
+
+
+def listar(pasta):
+    for tipologia in catalogo.tipologias:
+        manifesto = catalogo.ler_manifesto(tipologia, pasta)
+        if manifesto is None:
+            continue
+        print(f"{tipologia} (critério: {manifesto['criterio']})")
+        for seg in manifesto['segmentos']:
+            estado = 'fechado' if seg.get('fechado') else 'aberto'
+            print(f"  {seg['arquivo']:<40} {seg['linhas']:>8} linhas  "
+                  f"registros {seg['registro_min']}-{seg['registro_max']}  "
+                  f"anos {seg['ano_min']}-{seg['ano_max']}  {estado}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Particiona a planilha de uma tipologia.')
+    parser.add_argument('tipologia', nargs='?', choices=catalogo.tipologias, help='Tipologia a particionar.')
+    parser.add_argument('--criterio', choices=catalogo.CRITERIOS_PARTICAO, default='registro')
+    parser.add_argument('--tamanho', type=int, default=5000, help='Registros por segmento (critério "registro").')
+    parser.add_argument('--pasta', default='', help='Pasta das planilhas (padrão: pasta atual).')
+    parser.add_argument('--listar', action='store_true', help='Mostra os segmentos das tipologias particionadas.')
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        listar(args.pasta)
+        return
+    if not args.tipologia:
+        parser.error('informe a tipologia ou --listar')
+    try:
+        manifesto = catalogo.particionar_tipologia(args.tipologia, args.criterio, args.tamanho, args.pasta)
+    except catalogo.CatalogoError as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+    print(f"'{args.tipologia}' dividida em {len(manifesto['segmentos'])} segmento(s).")
+
+
+if __name__ == '__main__':
+    main()